@@ -0,0 +1,294 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from metrics import LatencyHistogram
+
+import logging
+log = logging.getLogger(__name__)
+
+# One poll of the device, timestamped (epoch seconds) at the moment of reading, unit is the slave id it came from
+Sample = namedtuple('Sample', ['timestamp', 'mass', 'raw', 'intInfo', 'realInfo', 'oneBitsInfo', 'unit'],
+                    defaults=(1,))
+
+
+class RateMeter:
+    # achieved sample rate over the last `window` seconds
+    def __init__(self, window=2.0):
+        self.window = window
+        self.timestamps = deque()
+
+    def update(self, timestamp: float):
+        self.timestamps.append(timestamp)
+        while timestamp - self.timestamps[0] > self.window:
+            self.timestamps.popleft()
+
+    @property
+    def rate(self) -> float:
+        if len(self.timestamps) < 2:
+            return 0.0
+        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+
+def auto_frequency(poll_time: float, units: int = 1, margin: float = 0.8) -> int:
+    # highest device sampling frequency whose polls of every unit on the bus fit into `margin` of the sample period
+    from modbusConnection import freq_translation
+    sustainable = margin / (poll_time * units) if poll_time > 0 else max(freq_translation.values())
+    return max((f for f in freq_translation.values() if f <= sustainable), default=min(freq_translation.values()))
+
+
+class AcquisitionWorker(threading.Thread):
+    """
+    Owns the ModbusClient(s) of one serial port and polls them at their device sampling frequency on its own thread,
+    so serial timeouts never block the Qt event loop. Several units on the same RS485 bus (clients sharing the port,
+    see ModbusClient.bus) are interleaved in one transaction stream - the unit with the earliest deadline is polled
+    next. Samples are pushed into a bounded deque per unit (append/popleft are atomic, no lock needed for a single
+    producer and a single consumer) and drained by the GUI in batches at display rate.
+    """
+    def __init__(self, modbusClients, queue_size=4096):
+        super(AcquisitionWorker, self).__init__(name='AcquisitionWorker', daemon=True)
+        self.modbusClients = list(modbusClients) if isinstance(modbusClients, (list, tuple)) else [modbusClients]
+        self.modbusClient = self.modbusClients[0]
+        self.clients = {client.unit: client for client in self.modbusClients}
+        self.queues = {client.unit: deque(maxlen=queue_size) for client in self.modbusClients}
+        self.samples = self.queues[self.modbusClient.unit]
+        self.rates = {client.unit: RateMeter() for client in self.modbusClients}
+        self.requests = deque()     # write requests (tare, min/max reset) executed between polls
+        self.deferred = []          # 'auto' frequency requests waiting for the first measured poll
+        self.dropped = 0            # samples overwritten because the consumer did not drain in time
+        self.errors = 0
+        self.lastError = None
+        self.pollLatency = LatencyHistogram()   # duration of a whole poll (all blocks of one unit)
+        self.pollTime = None        # smoothed poll duration [s], basis of the 'auto' sampling frequency
+        self.queuePeak = dict.fromkeys(self.queues, 0)
+        self._stopEvent = threading.Event()
+
+    def samplingFrequency(self, client=None) -> int:
+        # device rate of a unit (the first one by default), 4 /s until it has been read
+        client = self.modbusClient if client is None else client
+        return client.intInfo['Sampling frequency'] or 4
+
+    def run(self):
+        next_poll = dict.fromkeys(self.clients, time.perf_counter())
+        while not self._stopEvent.is_set():
+            unit, delay = self.next_unit(next_poll)
+            if delay > 0:
+                self._stopEvent.wait(delay)
+                continue
+            try:
+                while self.requests:
+                    self.apply_request(self.requests.popleft())
+                start = time.time()
+                intInfo, realInfo, oneBitsInfo = self.clients[unit].poll()
+                end = time.time()
+            except Exception as e:
+                self.poll_failed(unit, e)
+            else:
+                self.store_sample(unit, start, end, intInfo, realInfo, oneBitsInfo)
+            self.reschedule(next_poll, unit)
+
+    @staticmethod
+    def next_unit(next_poll: dict):
+        # the unit with the earliest deadline, and the time left until it is due
+        unit = min(next_poll, key=next_poll.get)
+        return unit, next_poll[unit] - time.perf_counter()
+
+    def reschedule(self, next_poll: dict, unit):
+        # absolute deadlines so the achieved rate follows the device rate instead of drifting with poll time
+        next_poll[unit] += 1 / self.samplingFrequency(self.clients[unit])
+        if next_poll[unit] < time.perf_counter():
+            next_poll[unit] = time.perf_counter()     # overrun - do not burst to catch up
+
+    def apply_request(self, request: dict):
+        for client, method, kwargs in self.request_calls(request):
+            getattr(client, method)(**kwargs)
+
+    def request_calls(self, request: dict) -> list:
+        # (client, method name, arguments) calls carrying out a queued request - executed by the threaded worker
+        # directly and awaited by the asyncio one
+        unit = request.get('unit')
+        clients = self.modbusClients if unit is None else [self.clients[unit]]
+        if 'sampling_frequency' not in request:
+            return [(client, 'send_request', {'tare': request['tare'], 'reset_min_max': request['reset_min_max']})
+                    for client in clients]
+        # the poll deadlines follow the new rate from the next sample on, and every consumer sees the change in
+        # intInfo['Sampling frequency'] of the samples themselves
+        frequency = request['sampling_frequency']
+        if frequency == 'auto':
+            if self.pollTime is None:   # not polled yet - the first poll measures the link
+                self.deferred.append(request)
+                return []
+            frequency = auto_frequency(self.pollTime, len(self.modbusClients))
+        for client in clients:
+            log.info(f"Unit {client.unit} sampling frequency set to {frequency} /s")
+        return [(client, 'set_samplingFrequency', {'frequency': frequency}) for client in clients]
+
+    def store_sample(self, unit, start: float, end: float, intInfo, realInfo, oneBitsInfo):
+        # middle of the block reads is the best estimate of when the values were sampled
+        sample_time = (start + end) / 2
+        duration = end - start
+        self.pollLatency.record(duration)
+        self.pollTime = duration if self.pollTime is None else self.pollTime + (duration - self.pollTime) / 8
+        if self.deferred:
+            self.requests.extend(self.deferred)
+            self.deferred.clear()
+        queue = self.queues[unit]
+        if len(queue) == queue.maxlen:
+            self.dropped += 1
+        queue.append(Sample(sample_time, realInfo['Actual mass'], intInfo['Current RAW signal'],
+                            dict(intInfo), dict(realInfo), dict(oneBitsInfo), unit))
+        self.rates[unit].update(sample_time)
+        if len(queue) > self.queuePeak[unit]:
+            self.queuePeak[unit] = len(queue)
+
+    def poll_failed(self, unit, error: Exception):
+        self.errors += 1
+        self.lastError = error
+        log.warning(f"Poll of unit {unit} failed: {error}")
+
+    def drain(self, max_count=None, unit=None) -> list:
+        queue = self.samples if unit is None else self.queues[unit]
+        batch = []
+        while queue and (max_count is None or len(batch) < max_count):
+            batch.append(queue.popleft())
+        return batch
+
+    def drain_all(self) -> list:
+        # samples of every unit, each unit's samples in order
+        batch = []
+        for unit in self.queues:
+            batch.extend(self.drain(unit=unit))
+        return batch
+
+    def send_request(self, tare=False, reset_min_max=False, unit=None):
+        # tare / min-max reset of one unit or (unit None) every unit of the port
+        self.requests.append({'tare': tare, 'reset_min_max': reset_min_max, 'unit': unit})
+
+    def set_samplingFrequency(self, frequency, unit=None):
+        # frequency in samples/s or 'auto', for one unit or (unit None) every unit of the port
+        self.requests.append({'sampling_frequency': frequency, 'unit': unit})
+
+    def stop(self, timeout=None):
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def health(self) -> dict:
+        units = {client.unit: {'configured_rate': client.intInfo['Sampling frequency'],
+                               'achieved_rate': round(self.rates[client.unit].rate, 2),
+                               'queue_depth': len(self.queues[client.unit]),
+                               'queue_peak': self.queuePeak[client.unit]} for client in self.modbusClients}
+        return {'port': self.modbusClient.port, 'units': units, 'errors': self.errors, 'dropped': self.dropped,
+                'last_error': repr(self.lastError) if self.lastError is not None else None,
+                'poll': self.pollLatency.snapshot(), 'modbus': self.modbusClient.metrics.snapshot(),
+                'auto_frequency': auto_frequency(self.pollTime, len(self.modbusClients)) if self.pollTime else None}
+
+
+class PollScheduler:
+    """
+    Polls any number of WDT-11 units: clients on the same serial port are interleaved by one AcquisitionWorker,
+    separate ports are polled in parallel, one worker thread per port.
+    """
+    def __init__(self, modbusClients, queue_size=4096, worker=AcquisitionWorker):
+        # worker - AcquisitionWorker, or asyncModbus.AsyncAcquisitionWorker for AsyncModbusClients
+        ports = {}
+        for client in modbusClients:
+            bus = client.bus if client.bus is not None else client
+            ports.setdefault(id(bus), []).append(client)
+        self.workers = [worker(clients, queue_size) for clients in ports.values()]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=None):
+        for worker in self.workers:
+            worker.stop(timeout)
+
+    def send_request(self, tare=False, reset_min_max=False, unit=None):
+        # unit None - every unit on every port
+        for worker in self.workers:
+            if unit is None or unit in worker.queues:
+                worker.send_request(tare, reset_min_max, unit)
+
+    def set_samplingFrequency(self, frequency, unit=None):
+        # frequency in samples/s or 'auto' (per port, from its measured poll time), unit None - every unit
+        for worker in self.workers:
+            if unit is None or unit in worker.queues:
+                worker.set_samplingFrequency(frequency, unit)
+
+    def drain_all(self) -> list:
+        batch = []
+        for worker in self.workers:
+            batch.extend(worker.drain_all())
+        return batch
+
+    def rates(self) -> dict:
+        # achieved sample rate per (port, unit)
+        return {(worker.modbusClient.port, unit): meter.rate for worker in self.workers
+                for unit, meter in worker.rates.items()}
+
+    def health(self) -> list:
+        # instrumentation of every port, see AcquisitionWorker.health
+        return [worker.health() for worker in self.workers]
+
+    @property
+    def errors(self):
+        return sum(worker.errors for worker in self.workers)
+
+    @property
+    def dropped(self):
+        return sum(worker.dropped for worker in self.workers)
+
+
+class Subscription:
+    # consumer of the sample bus, optionally throttled to max_rate deliveries per second (samples are batched, not lost)
+    # and limited to the samples of one unit
+    def __init__(self, callback, max_rate=None, unit=None):
+        self.callback = callback
+        self.unit = unit
+        self.min_interval = 1 / max_rate if max_rate else 0
+        self.pending = []
+        self.last_delivery = 0.0
+
+    def deliver(self, samples, now):
+        self.pending.extend(samples if self.unit is None else (s for s in samples if s.unit == self.unit))
+        if self.pending and now - self.last_delivery >= self.min_interval:
+            self.flush(now)
+
+    def flush(self, now=None):
+        # hands over the pending batch regardless of the rate limit
+        if self.pending:
+            batch, self.pending = self.pending, []
+            self.last_delivery = time.perf_counter() if now is None else now
+            self.callback(batch)
+
+
+class SampleBus:
+    """
+    Publish/subscribe fan-out of raw, full precision samples. Every published sample is delivered exactly once to
+    every subscriber (labels, live plot, recorder, statistics), each consumer decides how often it wants its batches.
+    """
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, callback, max_rate=None, unit=None) -> Subscription:
+        subscription = Subscription(callback, max_rate, unit)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription, flush=False):
+        # flush=True delivers the samples still held back by the subscriber's rate limit
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            if flush:
+                subscription.flush()
+
+    def publish(self, samples):
+        now = time.perf_counter()
+        for subscription in list(self.subscriptions):
+            try:
+                subscription.deliver(samples, now)
+            except Exception:
+                # one failing consumer must not starve the others of the batch
+                log.exception(f"Subscriber {subscription.callback!r} failed")
@@ -0,0 +1,284 @@
+"""
+Asyncio variant of modbusConnection.ModbusClient with its own Modbus RTU framing.
+
+Same update_intInfo / update_realInfo / update_oneBits / poll / send_request API (as coroutines), with line timing
+derived from the serial parameters instead of a fixed timeout in whole seconds:
+    - the minimum inter-frame gap (3.5 characters, 1.75 ms above 19200 baud) is computed from the baud rate,
+    - every request gets a response deadline = line time of request + expected response + estimated device
+      turnaround; the turnaround estimate adapts to measured response times (smoothed mean + 4 deviations, as TCP
+      retransmission timers do) and is capped by the configured timeout. As in TCP (Karn's algorithm) a timeout
+      doubles the deadline until a first attempt is answered again, and answers to retries are not measured,
+    - a response must match the request (unit, function code, length) - a late answer to an earlier request is
+      rejected as a framing error,
+    - a failed block (timeout, CRC or framing error) is retried right away a few times; if it still fails the rest
+      of the poll cycle continues and periodic / configuration values keep their last reading, but a poll missing any
+      'sample' field raises - a stale mass must not be published as a new sample.
+RTU allows only one outstanding request on a bus, so "pipelining" here means the frames of a poll plan are encoded
+once and sent back to back, separated only by the silent interval.
+
+The serial port is opened with pyserial-asyncio (serial_asyncio), or with any coroutine returning an asyncio
+(reader, writer) pair, e.g. WDT11Simulator.open_connection. Several units on one bus share the connection of the
+first one (bus=...). AsyncAcquisitionWorker polls them from an event loop on the acquisition thread, as a drop-in
+worker of acquisition.PollScheduler.
+"""
+import asyncio
+import struct
+import time
+
+from pymodbus.exceptions import ModbusIOException, InvalidMessageReceivedException
+from pymodbus.utilities import computeCRC
+
+from acquisition import AcquisitionWorker
+from metrics import ModbusMetrics
+from modbusConnection import WDT11Registers, intAddresses, freq_codes, registerMap
+
+
+class AsyncModbusClient(WDT11Registers):
+    def __init__(self, port, baudrate=19200, parity='N', stopbits=1, bytesize=8, timeout=1.0, unit=1, retries=2,
+                 open_connection=None, bus=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.bytesize = bytesize
+        self.timeout = timeout      # upper bound of a response deadline [s]
+        self.unit = unit
+        self.retries = retries
+        self.open_connection = open_connection
+        # another AsyncModbusClient on the same serial port - its connection and line timing are used
+        self.bus = bus
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+        self.init_registers(baudrate, bytesize, parity, stopbits)
+        self.frames = {}            # encoded request frames of poll blocks
+
+        self.char_time = (1 + bytesize + (0 if parity == 'N' else 1) + stopbits) / baudrate
+        self.silent_interval = 3.5 * self.char_time if baudrate <= 19200 else 0.00175
+        self.turnaround = 0.01      # smoothed device turnaround estimate [s]
+        self.turnaround_dev = 0.005
+        self.backoff = 1            # deadline multiplier, doubled by every timeout
+        self.last_frame_end = 0.0
+        self.failedBlocks = []      # blocks that failed in the last poll, after retries
+        self.metrics = ModbusMetrics() if bus is None else bus.metrics  # every attempt, retries included
+
+    # ---------------------------------------------------------------------------------------------- connection
+    async def connect(self) -> bool:
+        if self.bus is not None:
+            return await self.bus.connect()
+        if self.writer is not None:
+            return True
+        if self.open_connection is not None:
+            self.reader, self.writer = await self.open_connection()
+        else:
+            import serial_asyncio
+            self.reader, self.writer = await serial_asyncio.open_serial_connection(
+                url=self.port, baudrate=self.baudrate, parity=self.parity, stopbits=self.stopbits,
+                bytesize=self.bytesize)
+        return True
+
+    async def close(self):
+        if self.bus is not None:
+            return
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+        self.reader = self.writer = None
+        self.lock = asyncio.Lock()      # the next connection may belong to another event loop
+
+    # ---------------------------------------------------------------------------------------------- timing
+    def response_deadline(self, request_size: int, response_size: int) -> float:
+        line_time = (request_size + response_size) * self.char_time
+        estimate = line_time + self.turnaround + 4 * self.turnaround_dev + self.silent_interval
+        return min(estimate * self.backoff, self.timeout)
+
+    def update_turnaround(self, measured: float, request_size: int, response_size: int):
+        sample = max(measured - (request_size + response_size) * self.char_time, 0.0)
+        error = sample - self.turnaround
+        self.turnaround += error / 8
+        self.turnaround_dev += (abs(error) - self.turnaround_dev) / 4
+
+    # ---------------------------------------------------------------------------------------------- RTU framing
+    def encode(self, function: int, data: bytes) -> bytes:
+        frame = bytes([self.unit, function]) + data
+        return frame + struct.pack('>H', computeCRC(frame))
+
+    async def transact(self, frame: bytes, response_size: int) -> bytes:
+        # one request/response with retries, returns the response PDU (function code + data, no unit and CRC)
+        if self.bus is not None:
+            return await self.bus.transact(frame, response_size)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            start, quiet = time.perf_counter(), self.silent_interval * 2
+            try:
+                response = await self._transact_once(frame, response_size, measure=not attempt)
+            except asyncio.TimeoutError as e:
+                last_error, kind = e, 'timeout'
+                # the device is slower than estimated - back off towards the configured timeout
+                self.backoff = min(self.backoff * 2, 64)
+                # and give the late answer time to arrive, so the retry is not answered by it
+                quiet = self.response_deadline(len(frame), response_size)
+            except InvalidMessageReceivedException as e:
+                last_error, kind = e, 'crc' if 'CRC' in str(e) else 'other'
+            except ModbusIOException:
+                self.metrics.record(frame[1], time.perf_counter() - start, 'exception')
+                raise
+            else:
+                self.metrics.record(frame[1], time.perf_counter() - start)
+                return response
+            self.metrics.record(frame[1], time.perf_counter() - start, kind)
+            await self._discard_input(quiet)
+        raise ModbusIOException(f"No valid response after {self.retries + 1} attempts: {last_error!r}", frame[1])
+
+    async def _transact_once(self, frame: bytes, response_size: int, measure=True) -> bytes:
+        async with self.lock:
+            await self.connect()
+            gap = self.last_frame_end + self.silent_interval - time.perf_counter()
+            if gap > 0:
+                await asyncio.sleep(gap)
+            start = time.perf_counter()
+            self.writer.write(frame)
+            await self.writer.drain()
+            deadline = self.response_deadline(len(frame), response_size)
+            try:
+                response = await asyncio.wait_for(self._read_response(), deadline)
+            finally:
+                self.last_frame_end = time.perf_counter()
+            self.check_response(frame, response, response_size)
+            if measure:     # an answer to a retry may belong to an earlier attempt (Karn)
+                self.update_turnaround(self.last_frame_end - start, len(frame), len(response))
+                self.backoff = 1
+        if response[1] & 0x80:
+            raise ModbusIOException(f"Exception response, code {response[2]}", response[1] & 0x7F)
+        return response[1:-2]
+
+    @staticmethod
+    def check_response(frame: bytes, response: bytes, response_size: int):
+        if struct.pack('>H', computeCRC(response[:-2])) != response[-2:]:
+            raise InvalidMessageReceivedException("CRC error")
+        if response[0] != frame[0]:
+            raise InvalidMessageReceivedException(f"Response from unit {response[0]}, expected {frame[0]}")
+        if response[1] & 0x7F != frame[1]:
+            raise InvalidMessageReceivedException(f"Response to function {response[1] & 0x7F}, expected {frame[1]}")
+        if not response[1] & 0x80 and len(response) != response_size:
+            raise InvalidMessageReceivedException(f"Response of {len(response)} bytes, expected {response_size}")
+
+    async def _read_response(self) -> bytes:
+        header = await self.reader.readexactly(2)
+        function = header[1]
+        if function & 0x80:
+            return header + await self.reader.readexactly(3)
+        if function in (0x01, 0x02, 0x03, 0x04):
+            count = await self.reader.readexactly(1)
+            return header + count + await self.reader.readexactly(count[0] + 2)
+        return header + await self.reader.readexactly(6)
+
+    async def _discard_input(self, quiet: float):
+        # let the rest of a broken or late frame arrive and drop it, so the next response starts clean
+        try:
+            while True:
+                await asyncio.wait_for(self.reader.read(256), quiet)
+        except asyncio.TimeoutError:
+            pass
+
+    # ---------------------------------------------------------------------------------------------- Modbus functions
+    async def read_block(self, block) -> list:
+        function = 0x03 if block.function == 'holding' else 0x02
+        if block not in self.frames:
+            self.frames[block] = self.encode(function, struct.pack('>HH', block.address, block.count))
+        data_size = 2 * block.count if function == 0x03 else (block.count + 7) // 8
+        pdu = await self.transact(self.frames[block], data_size + 5)
+        if function == 0x03:
+            return list(struct.unpack(f'>{block.count}H', pdu[2:2 + data_size]))
+        return [bool(pdu[2 + i // 8] >> (i % 8) & 1) for i in range(block.count)]
+
+    async def write_coil(self, address: int, value: bool):
+        await self.transact(self.encode(0x05, struct.pack('>HH', address, 0xFF00 if value else 0)), 8)
+        if self.registerCache is not None:
+            self.registerCache.written('coil', address)
+
+    async def write_register(self, address: int, value: int):
+        await self.transact(self.encode(0x06, struct.pack('>HH', address, value)), 8)
+        if self.registerCache is not None:
+            self.registerCache.written('register', address)
+
+    # ---------------------------------------------------------------------------------------------- ModbusClient API
+    async def poll(self, plan=None):
+        self.failedBlocks = []
+        plan = self.due_plan(plan)
+        for block in plan:
+            try:
+                values = await self.read_block(block)
+            except ModbusIOException:
+                self.failedBlocks.append(block)     # still due in the cache, the other blocks are still read
+                continue
+            self.store_block(block, values)
+        stale = [block for block in self.failedBlocks
+                 if any(registerMap[key].refresh == 'sample' for info, key, offset, width in block.fields)]
+        if stale or (self.failedBlocks and len(self.failedBlocks) == len(plan)):
+            raise ModbusIOException(f"Poll failed: {stale or self.failedBlocks}")
+        return self.intInfo, self.realInfo, self.oneBitsInfo
+
+    async def update_intInfo(self):
+        await self.poll(self.intPlan)
+        return self.intInfo
+
+    async def update_oneBits(self):
+        await self.poll(self.oneBitsPlan)
+        return self.oneBitsInfo
+
+    async def update_realInfo(self):
+        await self.poll(self.realPlan)
+        return self.realInfo
+
+    async def send_request(self, tare=False, reset_min_max=False):
+        if tare:
+            await self.write_coil(4000, True)
+            await self.write_coil(4000, False)
+        elif reset_min_max:
+            await self.write_coil(4001, True)
+            await self.write_coil(4001, False)
+
+    async def set_samplingFrequency(self, frequency: int):
+        if frequency not in freq_codes:
+            raise ValueError(f"Unsupported sampling frequency {frequency}, expected one of {list(freq_codes)}")
+        await self.write_register(intAddresses['Sampling frequency'], freq_codes[frequency])
+        self.intInfo['Sampling frequency'] = frequency
+
+
+class AsyncAcquisitionWorker(AcquisitionWorker):
+    """
+    AcquisitionWorker of AsyncModbusClients: the units of one port are polled from an asyncio event loop running on
+    the worker thread, with the adaptive deadlines and block retries of AsyncModbusClient. Queues, requests and
+    health are those of the threaded worker, so PollScheduler(..., worker=AsyncAcquisitionWorker) is a drop-in.
+    """
+    def run(self):
+        asyncio.run(self.acquire())
+
+    async def acquire(self):
+        next_poll = dict.fromkeys(self.clients, time.perf_counter())
+        try:
+            while not self._stopEvent.is_set():
+                unit, delay = self.next_unit(next_poll)
+                if delay > 0:
+                    await asyncio.sleep(min(delay, 0.1))     # stop() is noticed within 100 ms
+                    continue
+                try:
+                    while self.requests:
+                        await self.apply_request(self.requests.popleft())
+                    start = time.time()
+                    intInfo, realInfo, oneBitsInfo = await self.clients[unit].poll()
+                    end = time.time()
+                except Exception as e:
+                    self.poll_failed(unit, e)
+                else:
+                    self.store_sample(unit, start, end, intInfo, realInfo, oneBitsInfo)
+                self.reschedule(next_poll, unit)
+        finally:
+            for client in self.modbusClients:
+                await client.close()
+
+    async def apply_request(self, request: dict):
+        for client, method, kwargs in self.request_calls(request):
+            await getattr(client, method)(**kwargs)
@@ -0,0 +1,299 @@
+"""
+Headless throughput / latency benchmark of the acquisition path, run against the simulated WDT-11 (wdtSimulator).
+
+Measures for every polling strategy and sampling frequency: achieved vs configured sample rate, missed and dropped
+samples and the per-transaction latency distribution. Also measures the cost of the sample consumers (live plot buffer,
+recorded plot level of detail, recorder, statistics, host signal processing, live readout panel with stub widgets -
+plus the Qt widgets when PyQt6 is installed) per GUI tick, the memory growth of a long recording and the startup
+time / memory of the headless CLI.
+Results are written as JSON, so polling strategies can be compared and regressions caught, e.g.:
+
+    python benchmark.py --duration 5 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from acquisition import AcquisitionWorker, Sample
+from asyncModbus import AsyncModbusClient, AsyncAcquisitionWorker
+from dataBuffers import RingBuffer
+from liveView import LiveViewModel
+from modbusConnection import ModbusClient, build_pollPlan, freq_translation, intAddresses, realAddresses
+from plotDecimation import MinMaxPyramid
+from recorder import StreamRecorder
+from runningStats import RunningStats, WindowedStats
+from signalProcessing import SignalPipeline
+from wdtSimulator import WDT11Simulator
+
+# polling strategies - name: poll plan factory, None - register cache (only the due fields are read)
+strategies = {
+    'cached': None,
+    'block': build_pollPlan,                        # coalesced block reads of every field
+    'per_value': lambda: build_pollPlan(max_gap=-1),  # one transaction per mapped value
+    'async': None,                                  # register cache, AsyncModbusClient on an event loop
+}
+
+
+def distribution(values) -> dict:
+    if not len(values):
+        return {'count': 0}
+    values = np.asarray(values) * 1000
+    return {'count': len(values), 'mean_ms': float(values.mean()), 'min_ms': float(values.min()),
+            'p50_ms': float(np.percentile(values, 50)), 'p95_ms': float(np.percentile(values, 95)),
+            'p99_ms': float(np.percentile(values, 99)), 'max_ms': float(values.max())}
+
+
+def timed_execute(client: ModbusClient, latencies: dict):
+    # wraps client.execute to collect transaction durations per function code
+    execute = client.execute
+
+    def wrapper(request):
+        start = time.perf_counter()
+        response = execute(request)
+        latencies.setdefault(request.function_code, []).append(time.perf_counter() - start)
+        return response
+    client.execute = wrapper
+
+
+def timed_transact(client: AsyncModbusClient, latencies: dict):
+    # same for AsyncModbusClient.transact (one request with its retries)
+    transact = client.transact
+
+    async def wrapper(frame, response_size):
+        start = time.perf_counter()
+        response = await transact(frame, response_size)
+        latencies.setdefault(frame[1], []).append(time.perf_counter() - start)
+        return response
+    client.transact = wrapper
+
+
+def benchmark_acquisition(strategy: str, frequency: int, duration: float, baudrate: int, display_rate=30) -> dict:
+    simulator = WDT11Simulator(sampling_frequency=frequency, baudrate=baudrate, waveform='sine', seed=0)
+    latencies = {}
+    if strategy == 'async':
+        client = AsyncModbusClient('simulator', baudrate=baudrate, timeout=1, open_connection=simulator.open_connection)
+        timed_transact(client, latencies)
+
+        async def first_poll():
+            await client.poll()
+            await client.close()    # reopened on the event loop of the worker thread
+        asyncio.run(first_poll())
+        worker = AsyncAcquisitionWorker(client)
+    else:
+        client = ModbusClient(method='rtu', port='simulator', timeout=1, baudrate=baudrate,
+                              transport=simulator.loopback)
+        client.connect()
+        if strategies[strategy] is not None:
+            client.registerCache = None
+            client.pollPlan = strategies[strategy]()
+        timed_execute(client, latencies)
+        client.poll()
+        worker = AcquisitionWorker(client)
+
+    timestamps = []
+    worker.start()
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        time.sleep(1 / display_rate)
+        timestamps.extend(sample.timestamp for sample in worker.drain())
+    worker.stop(timeout=2)
+    elapsed = time.perf_counter() - start
+    timestamps.extend(sample.timestamp for sample in worker.drain())
+    polls = len(timestamps) + worker.errors + 1
+
+    intervals = np.diff(timestamps) if len(timestamps) > 1 else []
+    expected = int(elapsed * frequency)
+    return {
+        'strategy': strategy,
+        'sampling_frequency': frequency,
+        'baudrate': baudrate,
+        'transactions_per_poll': sum(len(values) for values in latencies.values()) / polls,
+        'samples': len(timestamps),
+        'achieved_rate': len(timestamps) / elapsed,
+        'rate_ratio': len(timestamps) / elapsed / frequency,
+        'missed_samples': max(expected - len(timestamps), 0),
+        'dropped_samples': worker.dropped,
+        'poll_errors': worker.errors,
+        'sample_interval': distribution(intervals),
+        'transaction_latency': {str(code): distribution(values) for code, values in latencies.items()},
+        'health': worker.health(),      # built-in instrumentation, to compare with the exact distributions above
+    }
+
+
+def synthetic_samples(count: int, frequency: int, start=None) -> list:
+    start = time.time() if start is None else start
+    info = {'stability': True, 'overload_conn error': False, 'general error': False, 'input tara': False}
+    samples = []
+    first = round(start * frequency)     # the signal continues across batches
+    for i in range(first, first + count):
+        mass, raw = 500 * np.sin(i / 100), 2000 + i % 100
+        intInfo = dict.fromkeys(intAddresses, 0)
+        intInfo.update({'Current RAW signal': raw, 'Sampling frequency': frequency, 'Sensor capacity': 50})
+        realInfo = dict.fromkeys(realAddresses, 0.0)
+        realInfo.update({'Actual mass': mass, 'Maximum registered real force': 500.0, 'Real rated output': 2.0})
+        samples.append(Sample(start + (i - first) / frequency, mass, raw, intInfo, realInfo, info))
+    return samples
+
+
+class StubWidget:
+    # stands in for the Qt labels, buttons and progress bar - keeps the last value written
+    def __init__(self):
+        self.value = None
+
+    def setText(self, value):
+        self.value = value
+
+    setValue = setChecked = setText
+
+
+class StubView:
+    # any widget name of MassScaleMonitor, created on first use
+    def __getattr__(self, name):
+        widget = StubWidget()
+        setattr(self, name, widget)
+        return widget
+
+
+def benchmark_consumers(frequency: int, ticks: int, display_rate=30) -> dict:
+    # cost of delivering one GUI tick worth of samples to every consumer
+    batch_size = max(frequency // display_rate, 1)
+    batches = [synthetic_samples(batch_size, frequency, start=i * batch_size / frequency) for i in range(ticks)]
+    liveBuffer = RingBuffer(10 * frequency)
+    pyramid = MinMaxPyramid()
+    recorder = StreamRecorder('csv')
+    stats, windowStats = RunningStats(), WindowedStats(10)
+    pipeline = SignalPipeline(scale=0.1836)
+    # readout panel as in MassScaleMonitor.update_liveData (newest sample of the tick), widgets stubbed - headless
+    liveView = LiveViewModel(StubView(), ModbusClient(method='rtu', port='unused'), signal=pipeline)
+
+    def live(samples):
+        for sample in samples:
+            liveBuffer.append(sample.timestamp, sample.mass)
+        liveBuffer.window(10)
+
+    def recorded(samples):
+        pyramid.extend([s.timestamp for s in samples], [s.mass for s in samples])
+        pyramid.render(*pyramid.bounds(), 1000)
+
+    def statistics(samples):
+        for sample in samples:
+            stats.update(sample.timestamp, sample.mass)
+            windowStats.update(sample.timestamp, sample.mass)
+
+    consumers = {'live_plot_buffer': live, 'recorded_plot_lod': recorded, 'recorder': recorder.append,
+                 'statistics': statistics, 'signal_pipeline': pipeline.process,
+                 'live_view_render': lambda samples: liveView.render(samples[-1])}
+    consumers.update(gui_consumers())
+    results = {}
+    for name, consumer in consumers.items():
+        durations = []
+        for batch in batches:
+            start = time.perf_counter()
+            consumer(batch)
+            durations.append(time.perf_counter() - start)
+        results[name] = distribution(durations)
+    recorder.discard()
+    return {'batch_size': batch_size, 'ticks': ticks, 'per_tick': results}
+
+
+def gui_consumers() -> dict:
+    # real widgets, rendered offscreen - only when the GUI dependencies are installed
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6 import QtWidgets
+        import gui_code
+    except ImportError:
+        return {}
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    livePlot = gui_code.GraphWidget(timeAxis=False)
+    recordedPlot = gui_code.GraphWidget(timeAxis=True)
+    gui_consumers.keep_alive = (app, livePlot, recordedPlot)
+    return {'gui_livePlot_update': livePlot.livePlot_update, 'gui_record_plot': recordedPlot.record_plot}
+
+
+def benchmark_memory(frequency: int, seconds: int) -> dict:
+    # memory growth of the recording consumers for a long capture, fed in GUI tick sized batches
+    recorder = StreamRecorder('wdt')
+
+    def recorded_points(start, stop):
+        records = recorder.read(start, stop)
+        return records['timestamp'], records['mass']
+    pyramid = MinMaxPyramid(source=recorded_points)     # as in the GUI - summary levels only
+    stats = RunningStats()
+    batch_size = max(frequency // 30, 1)
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    checkpoints = []
+    for second in range(seconds):
+        for batch_start in range(0, frequency, batch_size):
+            batch = synthetic_samples(min(batch_size, frequency - batch_start), frequency,
+                                      start=second + batch_start / frequency)
+            recorder.append(batch)
+            pyramid.extend([s.timestamp for s in batch], [s.mass for s in batch])
+            for sample in batch:
+                stats.update(sample.timestamp, sample.mass)
+        if (second + 1) % max(seconds // 10, 1) == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            checkpoints.append({'recorded_seconds': second + 1, 'current_bytes': current, 'peak_bytes': peak})
+    growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+    tracemalloc.stop()
+    recorder.discard()
+    return {'sampling_frequency': frequency, 'recorded_seconds': seconds, 'samples': stats.count,
+            'growth_bytes': growth, 'bytes_per_sample': growth / max(stats.count, 1), 'checkpoints': checkpoints}
+
+
+def benchmark_startup() -> dict:
+    # headless entry point started in a fresh interpreter, as on the line PCs
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, 'massScaleCli.py', '--simulate', '--duration', '0', '--startup-report',
+                              '--output', '-'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    return {'wall_time_s': time.perf_counter() - start, 'returncode': process.returncode,
+            'report': process.stderr.strip().splitlines()[0] if process.stderr.strip() else ''}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=3.0, help="acquisition time per run [s]")
+    parser.add_argument('--frequencies', type=int, nargs='+', default=list(freq_translation.values()),
+                        choices=list(freq_translation.values()))
+    parser.add_argument('--strategies', nargs='+', default=list(strategies), choices=list(strategies))
+    parser.add_argument('--baudrate', type=int, default=19200)
+    parser.add_argument('--ticks', type=int, default=500, help="GUI ticks per consumer benchmark")
+    parser.add_argument('--memory-seconds', type=int, default=3600, help="simulated recording length [s]")
+    parser.add_argument('--output', default='-', help="JSON file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    results = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'date': datetime.now().isoformat(timespec='seconds')},
+        'acquisition': [],
+        'consumers': benchmark_consumers(max(args.frequencies), args.ticks),
+        'memory': benchmark_memory(max(args.frequencies), args.memory_seconds),
+        'startup': benchmark_startup(),
+    }
+    for strategy in args.strategies:
+        for frequency in args.frequencies:
+            result = benchmark_acquisition(strategy, frequency, args.duration, args.baudrate)
+            print(f"{strategy:>10} {frequency:>4} Hz: {result['achieved_rate']:7.1f} samples/s", file=sys.stderr)
+            results['acquisition'].append(result)
+
+    output = json.dumps(results, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(output)
+
+
+if __name__ == '__main__':
+    main()
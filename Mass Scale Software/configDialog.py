@@ -0,0 +1,83 @@
+from PyQt6 import QtWidgets, QtCore, QtGui
+from PyQt6.uic import loadUi
+
+from modbusConnection import ModbusClient
+
+
+class ConfigDialog(QtWidgets.QDialog):
+    def __init__(self):
+        super(ConfigDialog, self).__init__()
+        self.status = None
+        loadUi('uis/cofigurationDialog_UI.ui', self)
+        self.modbusConfig = {
+            'conn_mthd': 'rtu',
+            'port': 'COM3',
+            'timeout': 1,
+            'stopbits': 1,
+            'bytesize': 8,
+            'parity': 'N',
+            'baudrate': 19200
+        }
+        self.widgets = {
+            'port': self.portCombo,
+            'timeout': self.timeoutLine,
+            'parity': self.parityCombo,
+            'baudrate': self.baudCombo
+        }
+        self.options = {
+            'port': self.locate_usb(),
+            'parity': ["None", "Odd", "Even"],
+            'baudrate': ['9400', '19200', '38400', '57600', '115200']
+        }
+        self.modbusClient = None
+        for key in self.widgets.keys():
+            if type(self.widgets[key]) is QtWidgets.QComboBox:
+                self.widgets[key].setEditable(True)
+                self.widgets[key].lineEdit().setReadOnly(True)
+                self.widgets[key].lineEdit().setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+                self.widgets[key].addItems(self.options[key])
+            elif type(self.widgets[key]) is QtWidgets.QLineEdit:
+                self.widgets[key].setText('1')
+        self.unitsLine.setText('1')
+        self.modbusClients = []
+
+        self.baudCombo.setCurrentText('19200')
+        self.connectBtn.clicked.connect(lambda: (self.close() if self.connectModbus() else print(' ')))
+
+    def locate_usb(self):
+        from serial.tools import list_ports
+        port_connected = list_ports.comports(include_links=False)
+        portNames_list = []
+        for port in port_connected:
+            portNames_list.append(port.name)
+        return portNames_list
+
+    def connectModbus(self):
+        self.modbusConfig['port'] = self.portCombo.currentText()
+        self.modbusConfig['parity'] = self.parityCombo.currentText()[0].capitalize()
+        self.modbusConfig['baudrate'] = int(self.baudCombo.currentText())
+        self.modbusConfig['timeout'] = int(self.timeoutLine.text())
+        self.modbusConfig['units'] = [int(unit) for unit in self.unitsLine.text().replace(',', ' ').split()] or [1]
+        self.modbusClient = ModbusClient(method=self.modbusConfig['conn_mthd'], port=self.modbusConfig['port'],
+                                         timeout=self.modbusConfig['timeout'], stopbits=self.modbusConfig['stopbits'],
+                                         bytesize=self.modbusConfig['bytesize'], parity=self.modbusConfig['parity'],
+                                         baudrate=int(self.modbusConfig['baudrate']),
+                                         unit=self.modbusConfig['units'][0])
+        # further units on the same RS485 bus share the serial port of the first one
+        self.modbusClients = [self.modbusClient]
+        # (same serial parameters - their read-through gap is derived from them)
+        self.modbusClients.extend(ModbusClient(method=self.modbusConfig['conn_mthd'], port=self.modbusConfig['port'],
+                                               timeout=self.modbusConfig['timeout'],
+                                               stopbits=self.modbusConfig['stopbits'],
+                                               bytesize=self.modbusConfig['bytesize'],
+                                               parity=self.modbusConfig['parity'],
+                                               baudrate=int(self.modbusConfig['baudrate']), unit=unit,
+                                               bus=self.modbusClient)
+                                  for unit in self.modbusConfig['units'][1:])
+        print(f"connection to modbus, {self.modbusConfig}")
+        self.statusLbl.setText(f"Connecting to modbus...")
+        self.status = self.modbusClient.connect()
+        self.statusLbl.setText("Connection established!") if self.status else self.statusLbl.setText("Connection failed.")
+
+    def closeEvent(self, a0: QtGui.QCloseEvent):
+        return self.modbusClient, self.status
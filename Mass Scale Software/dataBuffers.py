@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed capacity circular buffer of (time, mass) points backed by preallocated NumPy arrays.
+    Every point is written twice (at i and i + capacity), so the last `capacity` points always form one contiguous
+    slice - view() returns NumPy views that can be handed to pyqtgraph without any per-tick copying.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self.x = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.y = np.zeros(2 * self.capacity, dtype=np.float64)
+        self.head = 0       # next write position
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x, y):
+        i = self.head
+        self.x[i] = self.x[i + self.capacity] = x
+        self.y[i] = self.y[i + self.capacity] = y
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.float64)[-self.capacity:]
+        ys = np.asarray(ys, dtype=np.float64)[-self.capacity:]
+        indexes = (self.head + np.arange(len(xs))) % self.capacity
+        self.x[indexes] = self.x[indexes + self.capacity] = xs
+        self.y[indexes] = self.y[indexes + self.capacity] = ys
+        self.head = (self.head + len(xs)) % self.capacity
+        self.count = min(self.count + len(xs), self.capacity)
+
+    def view(self):
+        # oldest -> newest, contiguous views into the backing arrays
+        end = self.head + self.capacity
+        return self.x[end - self.count:end], self.y[end - self.count:end]
+
+    def window(self, span: float):
+        # newest points not older than `span` before the newest one (x increasing, e.g. timestamps), still views
+        x, y = self.view()
+        first = np.searchsorted(x, x[-1] - span) if len(x) else 0
+        return x[first:], y[first:]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def resize(self, capacity: int):
+        # keeps the newest points that fit into the new capacity
+        x, y = self.view()
+        x, y = x.copy(), y.copy()
+        self.__init__(capacity)
+        self.extend(x, y)
+
+
+class GrowingBuffer:
+    # append-only columns of float64 in preallocated arrays, capacity doubles when full (amortized O(1) appends)
+    def __init__(self, columns: int = 2, capacity: int = 1024):
+        self.columns = [np.empty(capacity, dtype=np.float64) for _ in range(columns)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, *values):
+        n = len(values[0])
+        if self.count + n > len(self.columns[0]):
+            capacity = max(2 * len(self.columns[0]), self.count + n)
+            for i, column in enumerate(self.columns):
+                grown = np.empty(capacity, dtype=np.float64)
+                grown[:self.count] = column[:self.count]
+                self.columns[i] = grown
+        for column, column_values in zip(self.columns, values):
+            column[self.count:self.count + n] = column_values
+        self.count += n
+
+    def view(self):
+        return tuple(column[:self.count] for column in self.columns)
+
+    def clear(self):
+        self.count = 0
@@ -1,15 +1,20 @@
 import sys
+import threading
 
 from PyQt6 import QtWidgets, QtCore, QtGui
 from PyQt6.uic import loadUi
 import pyqtgraph as graph
-import pandas
 import random as rnd
 from datetime import datetime
 
 import time
 
-freq_translation = {0: 4, 1: 10, 2: 33, 3: 50, 4: 62, 5: 123}
+import numpy as np
+
+from dataBuffers import RingBuffer
+from plotDecimation import MinMaxPyramid
+from runningStats import RunningStats, WindowedStats
+from metrics import LatencyHistogram, MetricsFile
 
 
 def timestamp():
@@ -29,11 +34,9 @@ class TimeAxisItem(graph.AxisItem):
 
 
 class GraphWidget(graph.PlotWidget):
-    def __init__(self, timeAxis: bool, *args, **kwargs):
+    def __init__(self, timeAxis: bool, *args, window_seconds: float = 10, sampling_frequency: float = 123, **kwargs):
         super(GraphWidget, self).__init__(*args, **kwargs)
 
-        self.acquiredData = {'x_time': [], 'y_mass': []}
-
         self.timeAxis = TimeAxisItem(orientation='bottom')
         self.setAxisItems({'bottom': self.timeAxis})
         if not timeAxis:
@@ -48,60 +51,83 @@ class GraphWidget(graph.PlotWidget):
         self.enableAutoRange(axis='y')
         self.setAutoVisible(y=True)
 
-        self.x_axisPaddingTicks = 50
-        self.x_axisData = [timestamp()]
-        self.x_axisData.extend((timestamp() + 0.1) for _ in range(self.x_axisPaddingTicks - 1))
-        self.y_axisData = [0.0 for _ in range(self.x_axisPaddingTicks)]
         self.pen = graph.mkPen(color='#ff0000', width=2)
-        self.plotLineObj = self.plot(self.x_axisData, self.y_axisData, pen=self.pen)
-        self.timer = QtCore.QTimer()
-        self.timer.setInterval(1000)
-
-    def livePlot_update(self, value_ref: QtWidgets.QLabel):
-        timeStamp = timestamp()
-        self.x_axisData = self.x_axisData[1:]
-        self.x_axisData.append(timeStamp)
-        self.y_axisData = self.y_axisData[1:]
-        self.y_axisData.append(round(float(value_ref.text().replace(' g', ''))))
-        self.plotLineObj.setData(self.x_axisData, self.y_axisData)
-
-    def record_plot(self, value_ref: QtWidgets.QLabel):
-        if len(self.x_axisData) <= 10000:
-            timeStamp = timestamp()
-            value = float(value_ref.text().replace(' g', ''))
-            # update plot
-            self.x_axisData.append(timeStamp)
-            self.y_axisData.append(value)
-            self.plotLineObj.setData(self.x_axisData, self.y_axisData)
-            # update DataObject
-            self.acquiredData['x_time'].append(datetime.fromtimestamp(timeStamp).strftime("%H:%M:%S:%f")[:-5])
-            self.acquiredData['y_mass'].append(value)
-
+        self.unitColors = ['#ff0000', '#0000ff', '#00a000', '#ff8c00', '#8b008b', '#008b8b']
+        self.plotLineObj = self.plot([], [], pen=self.pen)
+        self.subscription = None    # SampleBus subscription feeding this plot
+        # live window: O(1) writes, contiguous views passed to pyqtgraph, one buffer and line per unit (scale)
+        self.window_seconds = window_seconds
+        self.sampling_frequency = sampling_frequency
+        self.unitFrequencies = {}   # device rate per unit, when it differs from sampling_frequency
+        self.liveBuffers = {}
+        self.liveLines = {}
+        # recording: multi-resolution summary, only ~2 points per pixel of the current view range are drawn
+        self.recordedData = MinMaxPyramid()
+        self._rendering = False
+        self.getViewBox().sigXRangeChanged.connect(lambda *_: self.render_recorded())
+
+    def set_liveWindow(self, window_seconds: float, sampling_frequency: float, unit=None):
+        # buffers of every unit, or only of `unit` (units on a bus may run at different device rates)
+        self.window_seconds = window_seconds
+        if unit is None:
+            self.sampling_frequency = sampling_frequency
+            self.unitFrequencies.clear()
+        else:
+            self.unitFrequencies[unit] = sampling_frequency
+        for bufferUnit, liveBuffer in self.liveBuffers.items():
+            if unit is None or bufferUnit == unit:
+                liveBuffer.resize(window_seconds * sampling_frequency)
+
+    def livePlot_update(self, samples: list):
+        for sample in samples:
+            if sample.unit not in self.liveBuffers:
+                self.add_unitLine(sample.unit)
+            self.liveBuffers[sample.unit].append(sample.timestamp, sample.mass)
+        # the buffers are sized for the device rate, the achieved rate is often lower - trim by time, not count
+        for unit in {sample.unit for sample in samples}:
+            self.liveLines[unit].setData(*self.liveBuffers[unit].window(self.window_seconds))
+
+    def add_unitLine(self, unit):
+        frequency = self.unitFrequencies.get(unit, self.sampling_frequency)
+        self.liveBuffers[unit] = RingBuffer(self.window_seconds * frequency)
+        if not self.liveLines:
+            self.liveLines[unit] = self.plotLineObj
         else:
-            self.timer.stop()
-            raise TimeoutError and print(f'Collected over 10 000 points of data!')
+            color = self.unitColors[len(self.liveLines) % len(self.unitColors)]
+            self.liveLines[unit] = self.plot([], [], pen=graph.mkPen(color=color, width=2))
+
+    def record_plot(self, samples: list):
+        self.recordedData.extend([sample.timestamp for sample in samples], [sample.mass for sample in samples])
+        self.render_recorded()
+
+    def render_recorded(self):
+        if self._rendering or not len(self.recordedData):
+            return
+        self._rendering = True
+        viewBox = self.getViewBox()
+        if viewBox.autoRangeEnabled()[0]:
+            x_min, x_max = self.recordedData.bounds()    # following the recording - whole range is visible
+        else:
+            x_min, x_max = viewBox.viewRange()[0]
+        self.plotLineObj.setData(*self.recordedData.render(x_min, x_max, max(int(viewBox.width()), 100)))
+        self._rendering = False
 
-    def save_recording(self):
-        df = pandas.DataFrame.from_dict(self.acquiredData)
-        print(df)
-        fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "QFileDialog.getSaveFileName()", "",
-                                                            "csv (*.csv)")
-        if fileName:
-            print(f"Saving at {fileName}")
-            df.to_csv(path_or_buf=fileName, sep=';')
-            print(f"File saved.")
+    def show_recording(self, pyramid: MinMaxPyramid):
+        # summary of a saved recording (see recorder.load_summary), only the visible range is read when drawing
+        self.clear()
+        self.reset_data()
+        self.recordedData = pyramid
+        self.enableAutoRange(axis='x')
+        self.render_recorded()
 
     def discard_recording(self):
         self.clear()
+        self.reset_data()   # the points were read back from the discarded file
 
-    def reset_data(self):
-        self.x_axisData = [timestamp()]
-        self.x_axisData.extend((timestamp() + 0.1) for _ in range(self.x_axisPaddingTicks - 1))
-        self.y_axisData = [0 for _ in range(self.x_axisPaddingTicks)]
-        self.acquiredData['x_time'] = []
-        self.acquiredData['y_mass'] = []
-        self.plotLineObj = self.plot(self.x_axisData, self.y_axisData, pen=self.pen)
-        self.timer = QtCore.QTimer()
+    def reset_data(self, source=None):
+        # source(start, stop) -> (times, values) of the recorded points, read back when zoomed in
+        self.recordedData.clear(source)
+        self.plotLineObj = self.plot([], [], pen=self.pen)
 
 
 class MassScaleMonitor(QtWidgets.QMainWindow):
@@ -109,6 +135,34 @@ class MassScaleMonitor(QtWidgets.QMainWindow):
         super(MassScaleMonitor, self).__init__(*args, **kwargs)
         self.mass_readout_precision = None
         self.liveTimer = None
+        self.pollScheduler = None
+        self.display_rate = 30  # GUI refresh rate [1/s], acquisition runs at the device sampling frequency
+        self.labels_rate = 20   # labels refresh rate [1/s], plots and recorder still get every sample
+        self.liveView = None
+        self.livePlot = None
+        self.samplingFrequency = None   # device rate of the displayed unit [samples/s], follows the sample stream
+        self.unitFrequencies = {}       # device rate of every unit, from its own samples
+        self.signalPipeline = None
+        self.signal_filter = 'average'  # host filter of the raw signal: 'none', 'average', 'median' or 'ema'
+        self.stability_threshold = 0.5  # max std of the mass over stability_window for host stability [g]
+        self.stability_window = 0.5     # [s] - in time, the achieved poll rate is well below the device rate
+        self.settle_time = 0.5          # time the mass has to stay within the threshold [s]
+        self.recordedInfo_rate = 4
+        self.statsWindow_seconds = 10   # windowed statistics shown in the recording summary
+        self.recordingStats = RunningStats()
+        self.recordingWindowStats = WindowedStats(self.statsWindow_seconds)
+        self.liveWindow_seconds = 10     # time span shown on the live plot
+        from acquisition import SampleBus
+        self.sampleBus = SampleBus()
+        self.recordedPlot = None
+        self.recordedInfoSubscription = None
+        self.recorder = None
+        self.summaryJob = None  # thread building the summary of an opened recording
+        self.recorderSubscription = None
+        self.tickLatency = LatencyHistogram()   # duration of a GUI tick (drain + delivery to every subscriber)
+        self.healthTimer = None
+        self.metricsFile = None         # MetricsFile with periodic health snapshots, set from File > Export metrics
+        self.recording_format = 'wdt'   # 'wdt' (compact binary), 'csv' or 'npy' (binary chunks)
         loadUi('uis/mainWindow_UI.ui', self)
         # self.dataPool = {'x_time': [], 'y_mass': []}
         self.dataPool_maxLength = 10000
@@ -125,15 +179,26 @@ class MassScaleMonitor(QtWidgets.QMainWindow):
         }
         from modbusConnection import ModbusClient
         self.modbusClient = None
+        self.modbusClients = []
         self.saveConfirmationFrame.hide()
         self.plotTabWidget.setTabEnabled(1, False)
         # ------------------------------------------------------------------------------ Btns scripts
         self.startRecordingBtn.clicked.connect(self.start_recordingData)
+        self.stopRecordingBtn.clicked.connect(self.stop_recordingData)
+        self.discardRecordingBtn.clicked.connect(lambda: self.discard_recordedPlot(self.recordedPlot))
+        # the temporary recording is removed only once it has been moved to the chosen file
+        self.saveRecordingBtn.clicked.connect(lambda: self.save_recording() and
+                                              self.discard_recordedPlot(self.recordedPlot))
         self.connectToModbusBtn.clicked.connect(self.connectToModbus)
+        self.actionOpenRecording.triggered.connect(self.open_recording)
+        self.actionExportRecording.triggered.connect(self.export_recording)
+        self.actionExportMetrics.triggered.connect(self.export_metrics)
         # ------------------------------------------------------------------------------ Plot timing object
 
     def connectToModbus(self):
-        from modbusConnection import ConfigDialog
+        if self.pollScheduler is not None:
+            return
+        from configDialog import ConfigDialog
         dialog = ConfigDialog()
         self.setEnabled(False)
         x = dialog.exec()
@@ -144,32 +209,43 @@ class MassScaleMonitor(QtWidgets.QMainWindow):
             self.connStatusLbl.setText(f"Receiving data...")
         from modbusConnection import ModbusClient
         self.modbusClient: ModbusClient = dialog.modbusClient
+        # labels, recording and statistics follow the first unit, the live plot shows all of them
+        self.modbusClients = dialog.modbusClients
         self.connectToModbusBtn.setChecked(True)
         self.connectToModbusBtn.setText('Connected')
-
-        self.modbusClient.update_intInfo()
-        self.modbusClient.update_realInfo()
-        self.modbusClient.update_oneBits()
-
-        self.ratedOutputLbl.setText(f"{round(self.modbusClient.realInfo['Real rated output'], 4)} mv/V")
-        self.sensorRangeLbl.setText(f"{self.modbusClient.intInfo['Sensor capacity']} N")
+        # the widgets below are wired once - a second connection would poll the port twice and double every signal
+        self.connectToModbusBtn.setEnabled(False)
+
+        for client in self.modbusClients:
+            client.poll()
+        self.unitFrequencies = {client.unit: client.intInfo['Sampling frequency'] for client in self.modbusClients}
+
+        # filtered mass, stability and plateaus computed on the host from the raw signal of the first unit
+        from signalProcessing import SignalPipeline, StabilityDetector
+        self.signalPipeline = SignalPipeline(self.modbusClient.mass_scaleFromRaw, filter=self.signal_filter,
+                                             stability=StabilityDetector(window=self.stability_window,
+                                                                         threshold=self.stability_threshold,
+                                                                         settle_time=self.settle_time))
+        from liveView import LiveViewModel
+        self.liveView = LiveViewModel(self, self.modbusClient, signal=self.signalPipeline)
 
         #   sampling frequency combo box setup
+        from modbusConnection import freq_translation
         self.samplingFreqCombo.setEditable(True)
         self.samplingFreqCombo.lineEdit().setReadOnly(True)
         self.samplingFreqCombo.lineEdit().setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
-        self.samplingFreqCombo.addItems([f"{freq_translation[key]} /s" for key in freq_translation.keys()])
-        self.samplingFreqCombo.setCurrentIndex(
-            list(freq_translation.values()).index(self.modbusClient.intInfo['Sampling frequency']))
-        self.samplingFreqToolBtn.clicked.connect(lambda: self.samplingFreqToolBtn.setEnabled(True))
-        self.samplingFreqToolBtn.clicked.connect(lambda: print('ADD FUNCTION FOR FREQ CHANGE - interval!'))  # TODO func
+        self.samplingFreqCombo.addItems([f"{freq_translation[key]} /s" for key in freq_translation.keys()] + ['auto'])
+        self.samplingFrequency = self.modbusClient.intInfo['Sampling frequency']
+        self.samplingFreqCombo.setCurrentIndex(list(freq_translation.values()).index(self.samplingFrequency))
+        self.samplingFreqToolBtn.clicked.connect(self.change_samplingFrequency)
         self.sensRangeToolBtn.clicked.connect(lambda: print('ADD FUNCTION FOR range'))
         self.ratedOutputToolBtn.clicked.connect(lambda: print('ADD FUNCTION FOR ratedoutput'))
 
         self.liveTimer = QtCore.QTimer()
-        self.liveTimer.timeout.connect(self.update_liveData)  # Update function (loop)
-        self.liveTimer.setInterval(int(1000 / self.modbusClient.intInfo['Sampling frequency']))
-        print(f"readout frequency set to {int(1000 / self.modbusClient.intInfo['Sampling frequency'])}")
+        self.liveTimer.timeout.connect(self.publish_samples)  # Update function (loop)
+        self.liveTimer.setInterval(int(1000 / self.display_rate))
+        print(f"readout frequency set to {self.modbusClient.intInfo['Sampling frequency']}, "
+              f"display refreshed every {int(1000 / self.display_rate)} ms")
         # decimal places combo setup
         self.decimalCombo.setEditable(True)
         self.decimalCombo.lineEdit().setReadOnly(True)
@@ -179,117 +255,319 @@ class MassScaleMonitor(QtWidgets.QMainWindow):
         self.decimalCombo.currentIndexChanged.connect(lambda x: self.change_readOutPrecision(int(x)))
         self.decimalCombo.setCurrentIndex(1)
 
+        self.rawSignalTare.textChanged.connect(self.change_rawTare)
         self.rawSignalTare.setText('0')
 
+        # serial I/O runs on acquisition threads (one per port) from now on - the GUI only drains their sample queues
+        from acquisition import PollScheduler
+        self.pollScheduler = PollScheduler(self.modbusClients)
+
         self.tareBtn.clicked.connect(
             lambda: (self.rawSignalTare.setText(str(self.modbusClient.intInfo['Current RAW signal'])),
-                     self.modbusClient.send_request(tare=True)))
-        self.minMaxResetBtn.clicked.connect(lambda: self.modbusClient.send_request(reset_min_max=True))
-
+                     self.pollScheduler.send_request(tare=True, unit=self.modbusClient.unit)))
+        self.minMaxResetBtn.clicked.connect(
+            lambda: (self.pollScheduler.send_request(reset_min_max=True, unit=self.modbusClient.unit),
+                     self.signalPipeline.capture.reset()))
+
+        # full rate, subscribed first - consumers are retuned before they get the samples at a new device rate
+        self.sampleBus.subscribe(self.track_samplingFrequency)
+        # full rate, subscribed before the labels so they show the newest processed sample
+        self.sampleBus.subscribe(self.signalPipeline.process, unit=self.modbusClient.unit)
+        self.sampleBus.subscribe(self.update_liveData, max_rate=self.labels_rate, unit=self.modbusClient.unit)
+        self.sampleBus.subscribe(self.update_connectionStatus, max_rate=1)
+        self.pollScheduler.start()
         self.liveTimer.start()
+        # independent of the sample flow - the panel keeps updating when the device stops answering
+        self.healthTimer = QtCore.QTimer()
+        self.healthTimer.timeout.connect(self.update_health)
+        self.healthTimer.start(1000)
         self.start_registering()
 
     def change_readOutPrecision(self, value):
         self.mass_readout_precision = value
+        self.liveView.precision = value
+
+    def change_samplingFrequency(self):
+        # written by the acquisition threads between polls, to every connected unit - no reconnect, no lost samples
+        text = self.samplingFreqCombo.currentText()
+        frequency = 'auto' if text == 'auto' else int(text.split()[0])
+        self.pollScheduler.set_samplingFrequency(frequency)
+        self.statusbar.showMessage(f"Sampling frequency set to {text}")
+
+    def track_samplingFrequency(self, samples: list):
+        # every sample carries the device rate it was polled at - consumers are retuned before they get the batch
+        newest = {sample.unit: sample.intInfo['Sampling frequency'] for sample in samples}
+        for unit, frequency in newest.items():
+            if frequency != self.unitFrequencies.get(unit):
+                self.retune(unit, frequency)
+
+    def retune(self, unit, frequency: int):
+        # live buffer of the unit, plus the combo box when it is the displayed unit
+        print(f"unit {unit} readout frequency changed from {self.unitFrequencies.get(unit)} to {frequency} /s")
+        self.unitFrequencies[unit] = frequency
+        if self.livePlot is not None:
+            self.livePlot.set_liveWindow(self.liveWindow_seconds, frequency, unit)
+        if unit != self.modbusClient.unit:
+            return
+        from modbusConnection import freq_translation
+        self.samplingFrequency = frequency
+        self.samplingFreqCombo.setCurrentIndex(list(freq_translation.values()).index(frequency))
+
+    def change_rawTare(self, text):
+        self.liveView.rawTare = int(text) if text.lstrip('-').isdigit() else 0
+        self.signalPipeline.tare = self.liveView.rawTare
+
+
+    def publish_samples(self):
+        # single acquisition source - every drained sample is delivered once to labels, plots, recorder and statistics
+        start = time.perf_counter()
+        batch = self.pollScheduler.drain_all()
+        if batch:
+            self.sampleBus.publish(batch)
+        self.tickLatency.record(time.perf_counter() - start)
+
+    def update_connectionStatus(self, samples: list):
+        rates = ', '.join(f"unit {unit}: {round(rate, 1)} /s" for (_, unit), rate in self.pollScheduler.rates().items())
+        self.connStatusLbl.setText(f"Receiving data... {rates}")
+
+    def health(self) -> dict:
+        return {'ports': self.pollScheduler.health(), 'gui_tick': self.tickLatency.snapshot()}
+
+    def update_health(self):
+        lines = []
+        for port in self.pollScheduler.health():
+            for unit, state in port['units'].items():
+                lines.append(f"{port['port']} unit {unit}: {state['achieved_rate']} / {state['configured_rate']} /s, "
+                             f"queue {state['queue_depth']} (peak {state['queue_peak']})")
+            modbus = port['modbus']
+            lines.extend(f"  {code}: {latency['count']} transactions, p50 {latency['p50_ms']} ms, "
+                         f"p95 {latency['p95_ms']} ms, max {latency['max_ms']} ms"
+                         for code, latency in modbus['latency'].items())
+            lines.append("  errors: " + ', '.join(f"{kind} {count}" for kind, count in modbus['errors'].items()) +
+                         f", failed polls {port['errors']}, dropped {port['dropped']}")
+        tick = self.tickLatency.snapshot()
+        lines.append(f"GUI tick: p50 {tick['p50_ms']} ms, p95 {tick['p95_ms']} ms, max {tick['max_ms']} ms")
+        self.healthLbl.setText('\n'.join(lines))
+        if self.metricsFile is not None:
+            self.metricsFile.update(self.health)
+
+    def export_metrics(self):
+        fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export metrics", "", "JSON lines (*.jsonl)")
+        if fileName:
+            self.metricsFile = MetricsFile(fileName)
+            self.statusbar.showMessage(f"Writing metrics to {fileName} every {self.metricsFile.interval} s")
 
-
-    def update_liveData(self):
-        received_intData = self.modbusClient.update_intInfo()
-        received_realdData = self.modbusClient.update_realInfo()
-        received_discrete = self.modbusClient.update_oneBits()
-
-        actual_mass_readOut = round(float(received_realdData['Actual mass']), self.mass_readout_precision)
-        self.actualMass.setText(f"{actual_mass_readOut} g")
-
-        self.minLbl.setText(f"{round(received_realdData['Minimum registered real force'], 1)} g")
-        self.maxLbl.setText(f"{round(received_realdData['Maximum registered real force'], 1)} g")
-
-        rawSignalSubtraction = int(received_intData['Current RAW signal']) - int(self.rawSignalTare.text())
-        self.massFromRawTare.setText(f"{round(rawSignalSubtraction*self.modbusClient.mass_scaleFromRaw, 2)} g")
-
-        self.actualRawSignal.setText(f"RAW: {received_intData['Current RAW signal']} "
-                             f"({round(received_intData['Current RAW signal'] * self.modbusClient.mV_scale, 3)} mV)")
-
-        sensor_load = (int(received_intData['Current RAW signal']) / self.modbusClient.maximum_raw_signal) * 100
-        self.progressBar.setValue(int(sensor_load))
-
-        self.stabilityBtn.setText("Stable") if received_discrete['stability'] else self.stabilityBtn.setText("Unstable")
-        self.stabilityBtn.setChecked(False) if received_discrete['stability'] else self.stabilityBtn.setChecked(True)
-
-        self.overloadErrBtn.setChecked(False) if not received_discrete[
-            'overload_conn error'] else self.overloadErrBtn.setChecked(True)
-        self.overloadErrBtn.setText(f"OK") if not received_discrete[
-            'overload_conn error'] else self.overloadErrBtn.setText(f"ERROR")
-
-        self.converterErrBtn.setChecked(False) if not received_discrete[
-            'general error'] else self.converterErrBtn.setChecked(True)
-        self.converterErrBtn.setText(f"OK") if not received_discrete[
-            'general error'] else self.converterErrBtn.setText(f"ERROR")
+    def update_liveData(self, samples: list):
+        # only the widgets whose value changed since the last refresh are written
+        self.liveView.render(samples[-1])
 
     def start_registering(self):
-        livePlot = GraphWidget(timeAxis=False)
+        livePlot = self.livePlot = GraphWidget(timeAxis=False, window_seconds=self.liveWindow_seconds,
+                                               sampling_frequency=self.samplingFrequency)
         livePlot.setTitle("Mass measurements in time", color='#ff0000', size='16pt')
         self.plotFreqSlider.setEnabled(True)
         self.refreshingRateFrame.hide()  # TODO: redesign slider to sampling frequency!
         # self.plotFreqSlider.valueChanged.connect(lambda value: (livePlot.timer.setInterval(int(1000 / value)),
         #                                                         self.plotFreqLbl.setText(f"{value} /s")))
         # self.plotFreqSlider.setValue(3)
+        for unit, frequency in self.unitFrequencies.items():
+            livePlot.set_liveWindow(self.liveWindow_seconds, frequency, unit)
         self.livePlotFrameLayout.addWidget(livePlot)
-        livePlot.timer.timeout.connect(lambda: livePlot.livePlot_update(self.actualMass))
-        livePlot.timer.setInterval(int(1000 / self.modbusClient.intInfo['Sampling frequency']))
-        livePlot.timer.start()
+        livePlot.subscription = self.sampleBus.subscribe(livePlot.livePlot_update)
 
     def start_recordingData(self):
+        if not self.release_recorder():
+            return
+        self.summaryJob = None
         self.plotTabWidget.setTabEnabled(1, True)
         self.plotTabWidget.setCurrentIndex(1)
-        if self.recordedTab.findChild(GraphWidget, 'recordedPlotWidget') is not None:
+        if self.recordedPlot is not None:
             # Update already existing plot
-            print(f"found recordedPlot at {self.recordedTab.findChild(GraphWidget, 'recordedPlotWidget')}")
-            recordedPlot = self.recordedTab.findChild(GraphWidget, 'recordedPlotWidget')
-            recordedPlot.reset_data()
-            recordedPlot.timer.timeout.connect(lambda: (recordedPlot.record_plot(self.actualMass),
-                                                        self.update_recordedInfo(recordedPlot.acquiredData['x_time'],
-                                                                                 recordedPlot.acquiredData['y_mass'])))
-            recordedPlot.timer.setInterval(int(1000 / self.modbusClient.intInfo['Sampling frequency']))
+            print(f"found recordedPlot at {self.recordedPlot}")
+            self.stop_recordingData(confirm=False)
         else:
-            # Create the plot (first run)
-            recordedPlot = GraphWidget(timeAxis=True)
-            recordedPlot.setObjectName('recordedPlotWidget')
-            recordedPlot.setTitle("Recorded mass measurements in time", color='#ff0000', size='16pt')
-            self.acquiredPlotFrameLayout.addWidget(recordedPlot)
-            recordedPlot.timer.timeout.connect(lambda: (recordedPlot.record_plot(self.actualMass),
-                                                        self.update_recordedInfo(recordedPlot.acquiredData['x_time'],
-                                                                                 recordedPlot.acquiredData['y_mass'])))
-
-        recordedPlot.timer.setInterval(int(1000 / self.modbusClient.intInfo['Sampling frequency']))
-        print(f"Recorded plot timer set to: {int(1000 / self.modbusClient.intInfo['Sampling frequency'])}")
-
-        recordedPlot.timer.start()
+            self.create_recordedPlot()
+
+        recordedPlot = self.recordedPlot
+        # samples are streamed to disk while recording, the plot keeps only its summary levels and reads
+        # full resolution points back from the file when zoomed in
+        from recorder import StreamRecorder, device_header
+        recorder = self.recorder = StreamRecorder(self.recording_format,
+                                                  header=device_header(self.modbusClient,
+                                                                       raw_tare=self.liveView.rawTare))
+
+        def recorded_points(start, stop):
+            records = recorder.read(start, stop)
+            return records['timestamp'], records['mass']
+        recordedPlot.clear()    # the previous recording, or an opened one, is still drawn
+        recordedPlot.reset_data(recorded_points if recorder.file_format == 'wdt' else None)
+        unit = self.modbusClient.unit
+        self.recorderSubscription = self.sampleBus.subscribe(self.recorder.append, unit=unit)
+        recordedPlot.subscription = self.sampleBus.subscribe(recordedPlot.record_plot, unit=unit)
+        self.recordingStats.reset()
+        self.recordingWindowStats.reset()
+        # batches are accumulated between refreshes, so statistics still see every sample
+        self.recordedInfoSubscription = self.sampleBus.subscribe(self.update_recordedInfo,
+                                                                 max_rate=self.recordedInfo_rate, unit=unit)
         print(f"Started registering at {datetime.fromtimestamp(timestamp())}")
 
-        self.stopRecordingBtn.clicked.connect(lambda: (recordedPlot.timer.stop(),
-                                                       self.saveConfirmationFrame.show()))
-        self.discardRecordingBtn.clicked.connect(lambda: self.discard_recordedPlot(recordedPlot))
-        self.saveRecordingBtn.clicked.connect(lambda: (recordedPlot.save_recording(),
-                                                       self.discard_recordedPlot(recordedPlot)))
-
-    def update_recordedInfo(self, x_values, y_values, clear: bool = False):
-        if len(x_values) > 2 and not clear:
-            d1 = datetime.strptime(x_values[-1], "%H:%M:%S:%f")
-            d2 = datetime.strptime(x_values[0], "%H:%M:%S:%f")
-            self.acquiredMinLbl.setText(str(min(y_values)))
-            self.acquiredMaxLbl.setText(str(max(y_values)))
-            self.acquiredDurationLbl.setText(f"{(d1 - d2).total_seconds()} s")
-            self.acquiaredPointsLbl.setText(str(len(x_values)))
+    def create_recordedPlot(self):
+        # Create the plot (first run)
+        self.recordedPlot = GraphWidget(timeAxis=True)
+        self.recordedPlot.setObjectName('recordedPlotWidget')
+        self.recordedPlot.setTitle("Recorded mass measurements in time", color='#ff0000', size='16pt')
+        self.acquiredPlotFrameLayout.addWidget(self.recordedPlot)
+
+    def open_recording(self):
+        fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open recording", "", "recording (*.wdt *.npy)")
+        if not fileName or not self.release_recorder():
+            return
+        self.saveConfirmationFrame.hide()
+        from recorder import open_recording, load_summary, build_summary
+        header, records = open_recording(fileName)
+        print(f"Opened {fileName}: {len(records)} samples, {header}")
+        self.plotTabWidget.setTabEnabled(1, True)
+        self.plotTabWidget.setCurrentIndex(1)
+        if self.recordedPlot is None:
+            self.create_recordedPlot()
+        self.recordedPlot.clear()
+        self.recordedPlot.reset_data()
+        self.recordingWindowStats.reset()
+        if len(records):
+            last = np.searchsorted(records['timestamp'], records['timestamp'][-1] - self.statsWindow_seconds)
+            for time_, mass in zip(records['timestamp'][last:].tolist(), records['mass'][last:].tolist()):
+                self.recordingWindowStats.update(time_, mass)
+
+        # plot levels and statistics are saved next to the recording, the first time built off the GUI thread
+        pyramid, stats = MinMaxPyramid(), RunningStats()
+        if load_summary(fileName, records, pyramid, stats):
+            self.show_openedRecording(pyramid, stats)
+            return
+        self.recordingStats.reset()
+        self.update_recordedInfo([])
+        job = self.summaryJob = threading.Thread(target=build_summary, args=(fileName, records, pyramid, stats),
+                                                 name='RecordingSummary', daemon=True)
+        job.start()
+
+        def finished():
+            if self.summaryJob is not job:
+                return      # another recording was opened or started meanwhile
+            if job.is_alive():
+                QtCore.QTimer.singleShot(100, finished)
+                return
+            self.show_openedRecording(pyramid, stats)
+        QtCore.QTimer.singleShot(100, finished)
+
+    def show_openedRecording(self, pyramid: MinMaxPyramid, stats: RunningStats):
+        self.summaryJob = None
+        self.recordedPlot.show_recording(pyramid)
+        self.recordingStats = stats
+        self.update_recordedInfo([])
+
+    def export_recording(self):
+        fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Export recording", "", "recording (*.wdt *.npy)")
+        if not fileName:
+            return
+        output, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export as", "", "csv (*.csv);;parquet (*.parquet)")
+        if not output:
+            return
+        from recorder import export_recording
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.CursorShape.WaitCursor)
+        try:
+            count = export_recording(fileName, output)
+            self.statusbar.showMessage(f"{count} samples exported to {output}")
+        except ImportError:
+            self.statusbar.showMessage("Parquet export requires pyarrow")
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+    def stop_recordingData(self, confirm=True):
+        # throttled subscribers still hold up to one interval of samples - the plot, statistics and file must agree
+        if self.recordedPlot is not None:
+            self.sampleBus.unsubscribe(self.recordedPlot.subscription, flush=True)
+        self.sampleBus.unsubscribe(self.recordedInfoSubscription, flush=True)
+        self.sampleBus.unsubscribe(self.recorderSubscription, flush=True)
+        if self.recorder is not None:
+            self.recorder.close()
+        if confirm:
+            self.saveConfirmationFrame.show()
+
+    def save_recording(self):
+        extension = self.recorder.extensions[self.recorder.file_format]
+        fileName, _ = QtWidgets.QFileDialog.getSaveFileName(self, "QFileDialog.getSaveFileName()", "",
+                                                            f"{self.recorder.file_format} (*{extension})")
+        if not fileName:
+            return False
+        print(f"Saving at {fileName}")
+        # recording is already on disk - saving is only a move of the finished file
+        self.recorder.save(fileName)
+        if self.recorder.file_format == 'wdt':
+            from recorder import save_summary
+            save_summary(fileName, self.recordedPlot.recordedData, self.recordingStats)  # reopened instantly
+        print(f"File saved.")
+        return True
+
+    def release_recorder(self) -> bool:
+        # stops the current recording and saves or discards its temporary file before it is replaced,
+        # False if the user cancelled
+        if self.recorder is None:
+            return True
+        if not self.recorder.saved and self.recorder.count:
+            buttons = QtWidgets.QMessageBox.StandardButton
+            answer = QtWidgets.QMessageBox.question(
+                self, "Unsaved recording", f"Save the current recording ({self.recorder.count} samples)?",
+                buttons.Save | buttons.Discard | buttons.Cancel, buttons.Save)
+            if answer == buttons.Cancel:
+                return False
+            self.stop_recordingData(confirm=False)
+            if answer == buttons.Save and not self.save_recording():
+                return False
+        else:
+            self.stop_recordingData(confirm=False)
+        self.recorder.discard()
+        self.recorder = None
+        return True
+
+    def update_recordedInfo(self, samples: list, clear: bool = False):
+        for sample in samples:
+            self.recordingStats.update(sample.timestamp, sample.mass)
+            self.recordingWindowStats.update(sample.timestamp, sample.mass)
+        stats, window = self.recordingStats, self.recordingWindowStats
+        if stats.count > 2 and not clear:
+            self.acquiredMinLbl.setText(f"{round(stats.min, 3)} g")
+            self.acquiredMaxLbl.setText(f"{round(stats.max, 3)} g")
+            self.acquiredMeanLbl.setText(f"{round(stats.mean, 3)} g")
+            self.acquiredStdLbl.setText(f"{round(stats.std, 3)} g")
+            self.acquiredDurationLbl.setText(f"{round(stats.duration, 1)} s")
+            self.acquiaredPointsLbl.setText(str(stats.count))
+            self.label_24.setText(f"Last {self.statsWindow_seconds} s")
+            self.acquiredWindowLbl.setText(f"min {round(window.min, 3)} g, max {round(window.max, 3)} g, "
+                                           f"mean {round(window.mean, 3)} g, std {round(window.std, 3)} g")
         else:
             self.acquiredMinLbl.setText("-------")
             self.acquiredMaxLbl.setText("-------")
+            self.acquiredMeanLbl.setText("-------")
+            self.acquiredStdLbl.setText("-------")
             self.acquiredDurationLbl.setText("-------")
             self.acquiaredPointsLbl.setText("-------")
+            self.acquiredWindowLbl.setText("-------")
+
+    def closeEvent(self, a0: QtGui.QCloseEvent):
+        if not self.release_recorder():
+            a0.ignore()
+            return
+        if self.pollScheduler is not None:
+            self.pollScheduler.stop(timeout=2)
+            if self.metricsFile is not None:
+                self.metricsFile.update(self.health, force=True)
+        super(MassScaleMonitor, self).closeEvent(a0)
 
     def discard_recordedPlot(self, plotObj: GraphWidget):
         plotObj.discard_recording()
-        self.update_recordedInfo([], [], True)
+        if self.recorder is not None:
+            self.recorder.discard()
+            self.recorder = None
+        self.update_recordedInfo([], True)
         self.saveConfirmationFrame.hide()
         self.plotTabWidget.setCurrentIndex(0)
         self.plotTabWidget.setTabEnabled(1, False)
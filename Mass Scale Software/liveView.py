@@ -0,0 +1,82 @@
+class LiveViewModel:
+    """
+    Display state of the live readout panel of MassScaleMonitor, computed from the newest sample.
+    render() diffs the new state against the last rendered one and only calls the widget setters whose value changed
+    (status bits and rated output are almost static), samples with the same inputs are skipped without building any
+    text. The refresh rate is capped by the caller (throttled SampleBus subscription), plots and recorder still get
+    every sample.
+    With a signalProcessing.SignalPipeline (fed at full rate by its own subscription) the mass from raw tare is the
+    filtered host-side mass, shown with the host stability and the captured peak / plateau.
+    """
+    def __init__(self, view, modbusClient, precision=1, signal=None):
+        self.view = view                # object holding the widgets, e.g. MassScaleMonitor
+        self.mass_scaleFromRaw = modbusClient.mass_scaleFromRaw
+        self.mV_scale = modbusClient.mV_scale
+        self.maximum_raw_signal = modbusClient.maximum_raw_signal
+        self.precision = precision      # decimal places of the actual mass
+        self.rawTare = 0                # raw signal subtracted for the mass from raw readout
+        self.signal = signal            # SignalPipeline of the displayed unit, or None
+        self.rendered = {}              # (widget, setter) -> value last written
+        self._lastInputs = None
+
+    def state(self, sample) -> dict:
+        intInfo, realInfo, oneBits = sample.intInfo, sample.realInfo, sample.oneBitsInfo
+        raw = int(intInfo['Current RAW signal'])
+        state = {
+            ('actualMass', 'setText'): f"{round(float(realInfo['Actual mass']), self.precision)} g",
+            ('minLbl', 'setText'): f"{round(realInfo['Minimum registered real force'], 1)} g",
+            ('maxLbl', 'setText'): f"{round(realInfo['Maximum registered real force'], 1)} g",
+            ('massFromRawTare', 'setText'): f"{round((raw - self.rawTare) * self.mass_scaleFromRaw, 2)} g",
+            ('actualRawSignal', 'setText'): f"RAW: {raw} ({round(raw * self.mV_scale, 3)} mV)",
+            ('progressBar', 'setValue'): int(raw / self.maximum_raw_signal * 100),
+            ('stabilityBtn', 'setText'): "Stable" if oneBits['stability'] else "Unstable",
+            ('stabilityBtn', 'setChecked'): not oneBits['stability'],
+            ('overloadErrBtn', 'setText'): "ERROR" if oneBits['overload_conn error'] else "OK",
+            ('overloadErrBtn', 'setChecked'): bool(oneBits['overload_conn error']),
+            ('converterErrBtn', 'setText'): "ERROR" if oneBits['general error'] else "OK",
+            ('converterErrBtn', 'setChecked'): bool(oneBits['general error']),
+            ('ratedOutputLbl', 'setText'): f"{round(realInfo['Real rated output'], 4)} mv/V",
+            ('sensorRangeLbl', 'setText'): f"{intInfo['Sensor capacity']} N",
+        }
+        if self.signal is not None:
+            state.update(self.signal_state())
+        return state
+
+    def signal_state(self) -> dict:
+        signal = self.signal
+        std = signal.stability.std
+        if signal.stable:
+            stability = "Stable"
+        elif std <= signal.stability.threshold:
+            stability = "Settling"
+        else:
+            stability = "Unstable"
+        capture = signal.capture
+        return {
+            ('massFromRawTare', 'setText'): f"{round(signal.mass, 2)} g",
+            ('hostStabilityLbl', 'setText'): f"{stability} (std {round(std, 2)} g)",
+            ('peakPlateauLbl', 'setText'): f"peak {round(capture.peak, 1)} g, plateau {round(capture.plateau, 1)} g",
+        }
+
+    def render(self, sample) -> int:
+        # returns the number of widget writes
+        inputs = (sample.mass, sample.raw, tuple(sample.intInfo.values()), tuple(sample.realInfo.values()),
+                  tuple(sample.oneBitsInfo.values()), self.precision, self.rawTare)
+        if self.signal is not None:
+            inputs += (self.signal.mass, self.signal.stable, self.signal.stability.std, self.signal.capture.peak,
+                       self.signal.capture.plateau)
+        if inputs == self._lastInputs:
+            return 0
+        self._lastInputs = inputs
+        writes = 0
+        for (widget, setter), value in self.state(sample).items():
+            if self.rendered.get((widget, setter)) != value:
+                getattr(getattr(self.view, widget), setter)(value)
+                self.rendered[(widget, setter)] = value
+                writes += 1
+        return writes
+
+    def invalidate(self):
+        # next render() writes every widget again
+        self.rendered.clear()
+        self._lastInputs = None
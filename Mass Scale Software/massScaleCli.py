@@ -0,0 +1,192 @@
+"""
+Headless acquisition of WDT-11 scales - logs samples unattended without PyQt6, pyqtgraph or pandas.
+
+Connects with the given serial parameters, polls every unit at its device sampling frequency and streams the samples
+to stdout or to a file (CSV, compact binary 'wdt' or .npy chunks), reporting achieved rate, errors and dropped samples on stderr, e.g.:
+
+    python massScaleCli.py --port COM3 --baudrate 19200 --units 1 2 --output scales.csv
+    python massScaleCli.py --simulate --duration 10 --startup-report
+    python massScaleCli.py --port /dev/ttyUSB0 --async --output scales.wdt --format wdt
+"""
+import time
+_start = time.perf_counter()
+
+import argparse
+import signal
+import sys
+
+from acquisition import PollScheduler
+from metrics import MetricsFile
+from modbusConnection import ModbusClient, freq_translation
+from recorder import StreamRecorder, csv_header, csv_line, device_header
+
+
+def startup_report() -> str:
+    # import time and peak resident memory, to keep the headless path light
+    report = f"startup {round((time.perf_counter() - _start) * 1000, 1)} ms"
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report += f", max RSS {round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)} MB"
+    except ImportError:
+        pass    # not available on Windows
+    loaded = sorted({name.split('.')[0] for name in sys.modules} & {'PyQt6', 'pyqtgraph', 'pandas', 'numpy'})
+    return report + f", heavy modules loaded: {', '.join(loaded) or 'none'}"
+
+
+def build_clients(args) -> list:
+    transport = None
+    if args.simulate:
+        from wdtSimulator import WDT11Simulator, SimulatedBus
+        bus = SimulatedBus([WDT11Simulator(unit=unit, baudrate=args.baudrate, parity=args.parity,
+                                           waveform='sine', mass=100 * unit) for unit in args.units])
+        transport = bus.loopback
+    primary = ModbusClient(method='rtu', port=args.port, timeout=args.timeout, stopbits=args.stopbits,
+                           bytesize=args.bytesize, parity=args.parity, baudrate=args.baudrate, unit=args.units[0],
+                           transport=transport)
+    clients = [primary]
+    clients.extend(ModbusClient(method='rtu', port=args.port, timeout=args.timeout, stopbits=args.stopbits,
+                                bytesize=args.bytesize, parity=args.parity, baudrate=args.baudrate, unit=unit,
+                                bus=primary)
+                   for unit in args.units[1:])
+    return clients
+
+
+def build_asyncClients(args) -> list:
+    # AsyncModbusClients (pyserial-asyncio, or the simulated bus), connected and polled once
+    import asyncio
+    from asyncModbus import AsyncModbusClient
+    open_connection = None
+    if args.simulate:
+        from wdtSimulator import WDT11Simulator, SimulatedBus
+        open_connection = SimulatedBus([WDT11Simulator(unit=unit, baudrate=args.baudrate, parity=args.parity,
+                                                       waveform='sine', mass=100 * unit)
+                                        for unit in args.units]).open_connection
+    primary = AsyncModbusClient(args.port, baudrate=args.baudrate, parity=args.parity, stopbits=args.stopbits,
+                                bytesize=args.bytesize, timeout=args.timeout, unit=args.units[0],
+                                open_connection=open_connection)
+    clients = [primary]
+    clients.extend(AsyncModbusClient(args.port, baudrate=args.baudrate, parity=args.parity, stopbits=args.stopbits,
+                                     bytesize=args.bytesize, timeout=args.timeout, unit=unit, bus=primary)
+                   for unit in args.units[1:])
+
+    async def first_poll():
+        # the acquisition thread runs its own event loop - the connection is opened again there
+        try:
+            for client in clients:
+                await client.poll()
+        finally:
+            await primary.close()
+    asyncio.run(first_poll())
+    return clients
+
+
+def write_samples(batch: list, recorder, with_unit: bool) -> int:
+    if recorder is not None:
+        recorder.append(batch)
+    elif batch:
+        sys.stdout.writelines(f"{sample.unit};{csv_line(sample)}" if with_unit else csv_line(sample)
+                              for sample in batch)
+        sys.stdout.flush()
+    return len(batch)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', default='COM3')
+    parser.add_argument('--baudrate', type=int, default=19200)
+    parser.add_argument('--parity', default='N', choices=['N', 'O', 'E'])
+    parser.add_argument('--stopbits', type=int, default=1)
+    parser.add_argument('--bytesize', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=1.0, help="response timeout [s]")
+    parser.add_argument('--sampling-frequency', default=None,
+                        choices=[str(f) for f in freq_translation.values()] + ['auto'],
+                        help="set the device sampling frequency [samples/s], 'auto' - highest the link sustains")
+    parser.add_argument('--units', type=int, nargs='+', default=[1], help="slave ids on the bus")
+    parser.add_argument('--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('--format', default='csv', choices=list(StreamRecorder.extensions))
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--report-interval', type=float, default=5.0, help="status report period on stderr [s]")
+    parser.add_argument('--metrics', default=None, help="append health snapshots (JSON lines) to this file")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="metrics snapshot period [s]")
+    parser.add_argument('--simulate', action='store_true', help="use simulated WDT-11 units instead of the port")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="poll with asyncio (adaptive response deadlines, block retries), needs pyserial-asyncio")
+    parser.add_argument('--startup-report', action='store_true', help="print startup time and memory on stderr")
+    args = parser.parse_args(argv)
+
+    if args.use_async:
+        try:
+            clients = build_asyncClients(args)
+        except Exception as e:
+            print(f"Connection to {args.port} failed: {e}", file=sys.stderr)
+            return 1
+    else:
+        clients = build_clients(args)
+        try:
+            if not clients[0].connect():
+                raise ConnectionError("port not opened")
+            for client in clients:
+                client.poll()
+        except Exception as e:
+            print(f"Connection to {args.port} failed: {e}", file=sys.stderr)
+            clients[0].close()
+            return 1
+    if args.startup_report:
+        print(startup_report(), file=sys.stderr)
+
+    if args.output == '-':
+        if args.format != 'csv':
+            parser.error("only csv can be streamed to stdout")
+        recorder = None
+        sys.stdout.write(f"unit;{csv_header}" if len(args.units) > 1 else csv_header)
+    else:
+        recorder = StreamRecorder(args.format, path=args.output, header=device_header(clients[0], units=args.units))
+
+    if args.use_async:
+        from asyncModbus import AsyncAcquisitionWorker
+        scheduler = PollScheduler(clients, worker=AsyncAcquisitionWorker)
+    else:
+        scheduler = PollScheduler(clients)
+    if args.sampling_frequency is not None:
+        # applied by the acquisition threads between polls ('auto' after the first one has measured the link),
+        # recorder and reports follow the samples
+        frequency = args.sampling_frequency
+        scheduler.set_samplingFrequency('auto' if frequency == 'auto' else int(frequency))
+    metricsFile = MetricsFile(args.metrics, args.metrics_interval) if args.metrics else None
+    health = lambda: {'ports': scheduler.health(), 'samples': written}
+    stopping = []
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    scheduler.start()
+    start = last_report = time.perf_counter()
+    written = 0
+    try:
+        while not stopping and (args.duration is None or time.perf_counter() - start < args.duration):
+            time.sleep(0.05)
+            written += write_samples(scheduler.drain_all(), recorder, len(args.units) > 1)
+            if time.perf_counter() - last_report >= args.report_interval:
+                last_report = time.perf_counter()
+                rates = ', '.join(f"unit {unit}: {round(rate, 1)} /s" for (_, unit), rate in scheduler.rates().items())
+                print(f"{written} samples, {rates}, errors {scheduler.errors}, dropped {scheduler.dropped}",
+                      file=sys.stderr)
+            if metricsFile is not None:
+                metricsFile.update(health)
+    except BrokenPipeError:
+        # reader of stdout went away (e.g. piped to head) - stop quietly
+        stopping.append('stdout closed')
+    finally:
+        scheduler.stop(timeout=2)
+        if 'stdout closed' not in stopping:
+            written += write_samples(scheduler.drain_all(), recorder, len(args.units) > 1)
+        if recorder is not None:
+            recorder.close()
+        if metricsFile is not None:
+            metricsFile.update(health, force=True)
+    elapsed = time.perf_counter() - start
+    print(f"{written} samples in {round(elapsed, 1)} s ({round(written / elapsed, 1)} /s), "
+          f"errors {scheduler.errors}, dropped {scheduler.dropped}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Always-on instrumentation of the acquisition path: fixed-size latency histograms and error counters, cheap enough
+to record every Modbus transaction (one perf_counter pair, a bisect over 21 bucket edges and a few integer
+increments), plus periodic export of snapshots as JSON lines.
+"""
+import json
+import math
+import time
+from bisect import bisect_left
+
+
+class LatencyHistogram:
+    # log spaced buckets from 0.1 ms to 10 s, 4 per decade, the last bucket collects everything slower
+    edges = [1e-4 * 10 ** (i / 4) for i in range(21)]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def percentile(self, p: float) -> float:
+        # upper edge of the bucket holding the p-th percentile (the maximum for the last bucket)
+        if not self.count:
+            return math.nan
+        rank = p / 100 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {'count': self.count, 'mean_ms': ms(self.mean), 'p50_ms': ms(self.percentile(50)),
+                'p95_ms': ms(self.percentile(95)), 'p99_ms': ms(self.percentile(99)), 'max_ms': ms(self.max),
+                'buckets': {f"le_{ms(edge)}ms" if i < len(self.edges) else 'inf': count
+                            for i, (edge, count) in enumerate(zip(self.edges + [math.inf], self.counts)) if count}}
+
+
+class ModbusMetrics:
+    """
+    Transactions of one serial port (shared by all units on the bus): latency histogram per function code and
+    error counters. Written by the acquisition thread only, read by the GUI / exporter - no lock, a snapshot may be
+    one transaction behind.
+    """
+    error_kinds = ('timeout', 'crc', 'exception', 'other')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latency = {}       # function code -> LatencyHistogram
+        self.errors = dict.fromkeys(self.error_kinds, 0)
+        self.transactions = 0
+
+    def record(self, function_code: int, seconds: float, error: str = None):
+        histogram = self.latency.get(function_code)
+        if histogram is None:
+            histogram = self.latency[function_code] = LatencyHistogram()
+        histogram.record(seconds)
+        self.transactions += 1
+        if error is not None:
+            self.errors[error] += 1
+
+    def snapshot(self) -> dict:
+        # copy of the items first - the acquisition thread adds a histogram at the first use of a function code
+        return {'transactions': self.transactions, 'errors': dict(self.errors),
+                'latency': {f"fc{code:02d}": histogram.snapshot() for code, histogram in list(self.latency.items())}}
+
+
+class MetricsFile:
+    # appends a JSON line with a timestamp and the snapshot every `interval` seconds
+    def __init__(self, path: str, interval: float = 10.0):
+        self.path = path
+        self.interval = interval
+        self.last_write = time.perf_counter()
+
+    def update(self, snapshot, force=False) -> bool:
+        # `snapshot` is called only when a line is due
+        if not force and time.perf_counter() - self.last_write < self.interval:
+            return False
+        self.last_write = time.perf_counter()
+        with open(self.path, 'a') as file:
+            file.write(json.dumps({'time': time.time(), **snapshot()}) + '\n')
+        return True
@@ -1,12 +1,14 @@
 import time
+from collections import namedtuple
 
 from pymodbus.client.sync import ModbusSerialClient
 from pymodbus.payload import BinaryPayloadDecoder as mdsDecoder
 from pymodbus.bit_read_message import ReadBitsResponseBase, ReadBitsRequestBase
 from pymodbus.constants import Endian
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
 
-from PyQt6 import QtWidgets, QtCore, QtGui
-from PyQt6.uic import loadUi
+from metrics import ModbusMetrics
 
 import sys
 
@@ -17,150 +19,314 @@ logging.basicConfig(format=FORMAT)
 log = logging.getLogger()
 #log.setLevel(logging.DEBUG)
 
-intAddresses = {
-    'Current force': 0,
-    'Minimum registered force': 2,
-    'Maximum registered force': 4,
-    'Current RAW signal': 6,
-    'Rated output': 8,
-    'Sensor capacity': 10,
-    'Sampling frequency': 12,
-    'Analog output': 13,
-    'Current force 2': 14,
-    'Measurement stability': 15
-}
-realAddresses = {
-    'Actual mass': 20,
-    'Minimum registered real force': 22,
-    'Maximum registered real force': 24,
-    'Analog output real': 26,
-    'Real rated output': 28
-}
-oneBitsReadRegisters={
-    'input tara': 5000,
-    'overload_conn error': 5001,
-    'general error': 5002,
-    'stability': 5003
+# Register map of the WDT-11: name -> (info dict, address, refresh policy, writes that invalidate the cached value)
+# refresh policy: 'sample' - read with every poll, seconds - re-read when older than that, 'demand' - read once (and
+# after invalidation), configuration changes only when someone writes it
+RegisterField = namedtuple('RegisterField', ['info', 'address', 'refresh', 'invalidated_by'])
+TARE_WRITE, RESET_MIN_MAX_WRITE = ('coil', 4000), ('coil', 4001)
+registerMap = {
+    'Current force': RegisterField('intInfo', 0, 1.0, ()),
+    'Minimum registered force': RegisterField('intInfo', 2, 0.5, (TARE_WRITE, RESET_MIN_MAX_WRITE)),
+    'Maximum registered force': RegisterField('intInfo', 4, 0.5, (TARE_WRITE, RESET_MIN_MAX_WRITE)),
+    'Current RAW signal': RegisterField('intInfo', 6, 'sample', ()),
+    'Rated output': RegisterField('intInfo', 8, 'demand', ()),
+    'Sensor capacity': RegisterField('intInfo', 10, 'demand', ()),
+    'Sampling frequency': RegisterField('intInfo', 12, 'demand', (('register', 12),)),
+    'Analog output': RegisterField('intInfo', 13, 1.0, ()),
+    'Current force 2': RegisterField('intInfo', 14, 1.0, ()),
+    'Measurement stability': RegisterField('intInfo', 15, 1.0, ()),     # same as the 'stability' discrete input
+    'Actual mass': RegisterField('realInfo', 20, 'sample', ()),
+    'Minimum registered real force': RegisterField('realInfo', 22, 0.5, (TARE_WRITE, RESET_MIN_MAX_WRITE)),
+    'Maximum registered real force': RegisterField('realInfo', 24, 0.5, (TARE_WRITE, RESET_MIN_MAX_WRITE)),
+    'Analog output real': RegisterField('realInfo', 26, 1.0, ()),
+    'Real rated output': RegisterField('realInfo', 28, 'demand', ()),
+    'input tara': RegisterField('oneBitsInfo', 5000, 'sample', ()),
+    'overload_conn error': RegisterField('oneBitsInfo', 5001, 'sample', ()),
+    'general error': RegisterField('oneBitsInfo', 5002, 'sample', ()),
+    'stability': RegisterField('oneBitsInfo', 5003, 'sample', ()),
 }
+intAddresses = {key: field.address for key, field in registerMap.items() if field.info == 'intInfo'}
+realAddresses = {key: field.address for key, field in registerMap.items() if field.info == 'realInfo'}
+oneBitsReadRegisters = {key: field.address for key, field in registerMap.items() if field.info == 'oneBitsInfo'}
 
-class ModbusClient(ModbusSerialClient):
-    def __init__(self, *args, **kwargs):
-        super(ModbusClient, self).__init__(*args, **kwargs)
+freq_translation = {0: 4, 1: 10, 2: 33, 3: 50, 4: 62, 5: 123}
+freq_codes = {frequency: code for code, frequency in freq_translation.items()}    # samples/s -> register 12 value
+
+MAX_REGISTERS_PER_READ = 125    # Modbus limit for function 0x03
+MAX_BITS_PER_READ = 2000        # Modbus limit for function 0x02
+
+
+class PollBlock:
+    # Single block read (one RTU transaction) covering several mapped values
+    def __init__(self, function, address, count):
+        self.function = function    # 'holding' (0x03) or 'discrete' (0x02)
+        self.address = address
+        self.count = count
+        self.fields = []            # (info name, key, offset in block, width)
+
+    def __repr__(self):
+        return f"PollBlock({self.function}, {self.address}-{self.address + self.count - 1}, {len(self.fields)} fields)"
+
+    def decode(self, values):
+        # values are raw registers (holding) or bits (discrete) returned for the whole block
+        for info, key, offset, width in self.fields:
+            if info == 'realInfo':
+                yield info, key, registers_toFloat(values[offset:offset + width])
+            elif info == 'oneBitsInfo':
+                yield info, key, bool(values[offset])
+            else:
+                yield info, key, values[offset]
+
+
+def registers_toFloat(registers) -> float:
+    # Decode 2 registers into single floating number with bits order [2,1,4,3] (Endian.Big + Endian.Little)
+    decoder_obj = mdsDecoder.fromRegisters(registers, byteorder=Endian.Big, wordorder=Endian.Little)
+    return decoder_obj.decode_32bit_float()
+
+
+def build_pollPlan(int_fields=None, real_fields=None, bit_fields=None, max_gap=8) -> list:
+    """
+    Merge the addresses of the requested fields into the fewest possible block reads.
+    Gaps of up to max_gap unused registers/bits are read through, as a few extra bytes on the line are much cheaper
+    than another request/response round trip (frame overhead, 3.5 char silent interval and device turnaround).
+    """
+    int_fields = intAddresses if int_fields is None else int_fields
+    real_fields = realAddresses if real_fields is None else real_fields
+    bit_fields = oneBitsReadRegisters if bit_fields is None else bit_fields
+
+    registers = [(address, 1, 'intInfo', key) for key, address in int_fields.items()]
+    registers.extend((address, 2, 'realInfo', key) for key, address in real_fields.items())
+    bits = [(address, 1, 'oneBitsInfo', key) for key, address in bit_fields.items()]
+
+    plan = _merge_spans('holding', registers, max_gap, MAX_REGISTERS_PER_READ)
+    plan.extend(_merge_spans('discrete', bits, max_gap, MAX_BITS_PER_READ))
+    return plan
+
+
+def _merge_spans(function, spans, max_gap, max_count) -> list:
+    blocks = []
+    block = None
+    for address, width, info, key in sorted(spans):
+        end = address + width
+        if block is None or address - (block.address + block.count) > max_gap or end - block.address > max_count:
+            block = PollBlock(function, address, width)
+            blocks.append(block)
+        block.count = max(block.count, end - block.address)
+        block.fields.append((info, key, address - block.address, width))
+    return blocks
+
+
+def read_throughGap(baudrate, bytesize=8, parity='N', stopbits=1, turnaround=0.002) -> int:
+    # unused registers worth reading through instead of starting another transaction: a transaction costs ~20
+    # characters (request, response header and CRC, two silent intervals) plus the device turnaround
+    char_time = (1 + bytesize + (0 if parity == 'N' else 1) + stopbits) / baudrate
+    return int((20 + turnaround / char_time) / 2)
+
+
+class RegisterCache:
+    """
+    Refresh state of the registerMap fields of one unit - the values themselves stay in intInfo / realInfo /
+    oneBitsInfo. plan() returns the block reads of the fields that are due (policy 'sample', expired periodic fields
+    and invalidated or never read fields); plans are built once per distinct set of due fields.
+    """
+    def __init__(self, fields=None, max_gap=8):
+        self.fields = registerMap if fields is None else fields
+        self.max_gap = max_gap
+        self.read_at = {}       # key -> perf_counter() of the last successful read, missing - must be read
+        self.plans = {}         # frozenset of due keys -> poll plan
+
+    def due(self, now: float) -> frozenset:
+        read_at = self.read_at
+        return frozenset(key for key, field in self.fields.items()
+                         if field.refresh == 'sample' or key not in read_at or
+                         (field.refresh != 'demand' and now - read_at[key] >= field.refresh))
+
+    def plan(self, now=None) -> list:
+        keys = self.due(time.perf_counter() if now is None else now)
+        plan = self.plans.get(keys)
+        if plan is None:
+            selected = {info: {key: field.address for key, field in self.fields.items()
+                               if key in keys and field.info == info}
+                        for info in ('intInfo', 'realInfo', 'oneBitsInfo')}
+            plan = self.plans[keys] = build_pollPlan(selected['intInfo'], selected['realInfo'],
+                                                     selected['oneBitsInfo'], max_gap=self.max_gap)
+        return plan
+
+    def mark_read(self, block: PollBlock, now=None):
+        now = time.perf_counter() if now is None else now
+        for info, key, offset, width in block.fields:
+            self.read_at[key] = now
+
+    def invalidate(self, *keys):
+        # the fields (every field if none is given) are read with the next poll
+        for key in keys or list(self.read_at):
+            self.read_at.pop(key, None)
+
+    def written(self, kind: str, address: int):
+        # after a write ('coil' or 'register') - fields depending on it are read again
+        self.invalidate(*(key for key, field in self.fields.items() if (kind, address) in field.invalidated_by))
+
+
+class WDT11Registers:
+    """
+    Device side state shared by ModbusClient and asyncModbus.AsyncModbusClient: the calibration of the WDT-11, the
+    decoded values (intInfo, realInfo, oneBitsInfo), the block read plans and the register cache. The clients add
+    the transport - read_block() and the poll loop, synchronous or as coroutines.
+    """
+    maximum_raw_signal = 3366      # calculated from WDT readouts
+    mV_scale = 0.00078691347       #   calculated from WDT readouts
+    mass_scaleFromRaw = 0.18355970571590265987549518958687
+
+    def init_registers(self, baudrate, bytesize, parity, stopbits):
         self.intInfo = dict.fromkeys(intAddresses.keys(), 0)
         self.realInfo = dict.fromkeys(realAddresses.keys(), 0.0)
         self.oneBitsInfo = dict.fromkeys(oneBitsReadRegisters.keys(), 0)
-        self.maximum_raw_signal = 3366      # calculated from WDT readouts
-        self.mV_scale = 0.00078691347       #   calculated from WDT readouts
-        self.mass_scaleFromRaw = 0.18355970571590265987549518958687
+        # block read plans, built once - registers 0-29 and discrete inputs 5000-5003 give 2 transactions per poll
+        self.pollPlan = build_pollPlan()
+        self.intPlan = build_pollPlan(real_fields={}, bit_fields={})
+        self.realPlan = build_pollPlan(int_fields={}, bit_fields={})
+        self.oneBitsPlan = build_pollPlan(int_fields={}, real_fields={})
+        # poll() without a plan reads only the fields that are due - static configuration is not re-read every sample
+        self.registerCache = RegisterCache(max_gap=read_throughGap(baudrate, bytesize, parity, stopbits))
+
+    def due_plan(self, plan=None) -> list:
+        # without a plan: the due fields of the register cache, or pollPlan (everything) when the cache is disabled
+        if plan is not None:
+            return plan
+        return self.registerCache.plan() if self.registerCache is not None else self.pollPlan
+
+    def store_block(self, block: PollBlock, values: list):
+        # decodes the values of one block read into the info dicts
+        for info, key, value in block.decode(values):
+            getattr(self, info)[key] = value
+            if key == 'Sampling frequency':
+                self.intInfo[key] = freq_translation[value]
+        if self.registerCache is not None:
+            self.registerCache.mark_read(block)
+
+
+def transaction_error(response):
+    # error kind of a pymodbus response for ModbusMetrics, None for a valid response
+    if isinstance(response, ExceptionResponse):
+        return 'exception'
+    if isinstance(response, ModbusIOException):
+        # the sync transaction manager reports a frame failing the CRC check as undecodable
+        message = str(response)
+        return 'timeout' if 'No response' in message or 'Incomplete message' in message else 'crc'
+    if response is None or (hasattr(response, 'isError') and response.isError()):
+        return 'other'
+    return None
+
+
+class ModbusClient(ModbusSerialClient, WDT11Registers):
+    def __init__(self, *args, unit=1, bus=None, transport=None, **kwargs):
+        super(ModbusClient, self).__init__(*args, **kwargs)
+        self.unit = unit    # slave id of the WDT-11 on the RS485 bus
+        # another ModbusClient already connected to the same serial port - its transactions (and the port) are shared,
+        # so several units on one bus form a single serial transaction stream
+        self.bus = bus
+        # optional factory of a serial-like object used instead of opening self.port (e.g. WDT11Simulator.loopback)
+        self.transport = transport
+        self.init_registers(self.baudrate, self.bytesize, self.parity, self.stopbits)
+        self.metrics = ModbusMetrics() if bus is None else bus.metrics     # per serial port
+
+    def connect(self):
+        if self.bus is not None:
+            return self.bus.connect()
+        if self.transport is not None and not self.socket:
+            self.socket = self.transport(timeout=self.timeout)
+        return super(ModbusClient, self).connect()
+
+    def close(self):
+        if self.bus is None:
+            super(ModbusClient, self).close()
+
+    def execute(self, request=None):
+        if self.bus is not None:
+            return self.bus.execute(request)
+        start = time.perf_counter()
+        try:
+            response = super(ModbusClient, self).execute(request)
+        except Exception:
+            self.metrics.record(request.function_code, time.perf_counter() - start, 'other')
+            raise
+        self.metrics.record(request.function_code, time.perf_counter() - start, transaction_error(response))
+        return response
 
     def decode_toFloat(self, first_register_address) -> float:
         # first acquire 2 registers, first is low part of a real number, second is high part
-        registers = self.read_holding_registers(address=first_register_address, count=2, unit=1).registers
-        # Decode 2 acquired registers into single floating number with bits order [2,1,4,3] (Endian.Big + Endian.Little)
-        decoder_obj = mdsDecoder.fromRegisters(registers, byteorder=Endian.Big, wordorder=Endian.Little)
-        return decoder_obj.decode_32bit_float()
+        registers = self.read_holding_registers(address=first_register_address, count=2, unit=self.unit).registers
+        return registers_toFloat(registers)
 
-    def update_intInfo(self):
-        curr_readout = self.read_holding_registers(address=0, count=16, unit=1)
-        for key in self.intInfo.keys():
-            self.intInfo[key] = curr_readout.registers[intAddresses[key]]
+    def read_block(self, block: PollBlock) -> list:
+        if block.function == 'holding':
+            response = self.read_holding_registers(address=block.address, count=block.count, unit=self.unit)
+        else:
+            response = self.read_discrete_inputs(address=block.address, count=block.count, unit=self.unit)
+        if response.isError():
+            raise ModbusIOException(f"{block} failed: {response}")
+        return response.registers if block.function == 'holding' else response.bits
+
+    def poll(self, plan=None):
+        # execute every block read of the plan (see due_plan) and decode all values from the received buffers
+        for block in self.due_plan(plan):
+            self.store_block(block, self.read_block(block))
+        return self.intInfo, self.realInfo, self.oneBitsInfo
+
+    def refresh(self, *keys):
+        # on demand: the fields (all if none given) are read with the next poll
+        if self.registerCache is not None:
+            self.registerCache.invalidate(*keys)
 
-        freq_translation = {0: 4, 1: 10, 2: 33, 3: 50, 4:62, 5:123}
-        self.intInfo['Sampling frequency'] = freq_translation[self.intInfo['Sampling frequency']]
+    def write_coil(self, address, value, **kwargs):
+        response = super(ModbusClient, self).write_coil(address, value, **kwargs)
+        if self.registerCache is not None:
+            self.registerCache.written('coil', address)
+        return response
 
+    def write_register(self, address, value, **kwargs):
+        response = super(ModbusClient, self).write_register(address, value, **kwargs)
+        if self.registerCache is not None:
+            self.registerCache.written('register', address)
+        return response
+
+    def update_intInfo(self):
+        self.poll(self.intPlan)
         return self.intInfo
 
     def update_oneBits(self):
-        # reading discrete inputs (1 Bit info), have to return bits[0] as a form of boolean value
-        for key in self.oneBitsInfo.keys():
-            self.oneBitsInfo[key] = self.read_discrete_inputs(address=oneBitsReadRegisters[key], count=1, unit=1).bits[0]
+        # discrete inputs (1 Bit info) are decoded to boolean values
+        self.poll(self.oneBitsPlan)
         return self.oneBitsInfo
 
     def update_realInfo(self):
-        for key in self.realInfo.keys():
-            self.realInfo[key] = self.decode_toFloat(realAddresses[key])
+        self.poll(self.realPlan)
         return self.realInfo
 
     def send_request(self, tare=False, reset_min_max=False):
         if tare:
-            x = self.write_coil(4000, True, unit=1)
-            y = self.write_coil(4000, False, unit=1)
+            x = self.write_coil(4000, True, unit=self.unit)
+            y = self.write_coil(4000, False, unit=self.unit)
             print(f'Scale tared. {x} {y}')
         elif reset_min_max:
-            x = self.write_coil(4001, True, unit=1)
-            y = self.write_coil(4001, False, unit=1)
+            x = self.write_coil(4001, True, unit=self.unit)
+            y = self.write_coil(4001, False, unit=self.unit)
             print(f'Min/Max reseted. {x} {y}')
 
-class ConfigDialog(QtWidgets.QDialog):
-    def __init__(self):
-        super(ConfigDialog, self).__init__()
-        self.status = None
-        loadUi('uis/cofigurationDialog_UI.ui', self)
-        self.modbusConfig = {
-            'conn_mthd': 'rtu',
-            'port': 'COM3',
-            'timeout': 1,
-            'stopbits': 1,
-            'bytesize': 8,
-            'parity': 'N',
-            'baudrate': 19200
-        }
-        self.widgets = {
-            'port': self.portCombo,
-            'timeout': self.timeoutLine,
-            'parity': self.parityCombo,
-            'baudrate': self.baudCombo
-        }
-        self.options = {
-            'port': self.locate_usb(),
-            'parity': ["None", "Odd", "Even"],
-            'baudrate': ['9400', '19200', '38400', '57600', '115200']
-        }
-        self.modbusClient = None
-        for key in self.widgets.keys():
-            if type(self.widgets[key]) is QtWidgets.QComboBox:
-                self.widgets[key].setEditable(True)
-                self.widgets[key].lineEdit().setReadOnly(True)
-                self.widgets[key].lineEdit().setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
-                self.widgets[key].addItems(self.options[key])
-            elif type(self.widgets[key]) is QtWidgets.QLineEdit:
-                self.widgets[key].setText('1')
-
-        self.baudCombo.setCurrentText('19200')
-        self.connectBtn.clicked.connect(lambda: (self.close() if self.connectModbus() else print(' ')))
-
-    def locate_usb(self):
-        from serial.tools import list_ports
-        port_connected = list_ports.comports(include_links=False)
-        portNames_list = []
-        for port in port_connected:
-            portNames_list.append(port.name)
-        return portNames_list
-
-    def connectModbus(self):
-        self.modbusConfig['port'] = self.portCombo.currentText()
-        self.modbusConfig['parity'] = self.parityCombo.currentText()[0].capitalize()
-        self.modbusConfig['baudrate'] = int(self.baudCombo.currentText())
-        self.modbusConfig['timeout'] = int(self.timeoutLine.text())
-        self.modbusClient = ModbusClient(method=self.modbusConfig['conn_mthd'], port=self.modbusConfig['port'],
-                                         timeout=self.modbusConfig['timeout'], stopbits=self.modbusConfig['stopbits'],
-                                         bytesize=self.modbusConfig['bytesize'], parity=self.modbusConfig['parity'],
-                                         baudrate=int(self.modbusConfig['baudrate']))
-        print(f"connection to modbus, {self.modbusConfig}")
-        self.statusLbl.setText(f"Connecting to modbus...")
-        self.status = self.modbusClient.connect()
-        self.statusLbl.setText("Connection established!") if self.status else self.statusLbl.setText("Connection failed.")
-
-    def closeEvent(self, a0: QtGui.QCloseEvent):
-        return self.modbusClient, self.status
+    def set_samplingFrequency(self, frequency: int):
+        # frequency in samples/s, one of freq_translation values - takes effect with the next poll
+        if frequency not in freq_codes:
+            raise ValueError(f"Unsupported sampling frequency {frequency}, expected one of {list(freq_codes)}")
+        response = self.write_register(intAddresses['Sampling frequency'], freq_codes[frequency], unit=self.unit)
+        if response.isError():
+            raise ModbusIOException(f"Sampling frequency not set: {response}")
+        self.intInfo['Sampling frequency'] = frequency
 
 if __name__ == "__main__":
     client = ModbusClient(method='rtu', port='COM3', timeout=3, stopbits=1, bytesize=8, parity='N', baudrate=19200)
     client.connect()
-    y=0
-    client.update_realInfo()
+    print(client.pollPlan)
+    client.poll()
     print(client.realInfo)
-    client.update_intInfo()
     print(client.intInfo)
-    client.update_oneBits()
     print(client.oneBitsInfo)
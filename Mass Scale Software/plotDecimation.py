@@ -0,0 +1,131 @@
+import numpy as np
+
+from dataBuffers import GrowingBuffer
+
+
+class MinMaxPyramid:
+    """
+    Level of detail summary of a (time, mass) series for plotting long recordings.
+    Level 0 stores (bucket start time, min, max) of every `factor` full resolution points, every next level the same
+    for `factor` buckets of the previous one - levels are extended incrementally as complete buckets arrive, so an
+    append costs O(batch) regardless of the recording length.
+    Only the levels are kept in memory (~1/factor of the points). Full resolution points are read back through
+    `source(start, stop) -> (times, values)` - e.g. the file being recorded or a memory-mapped recording - only when
+    the user zooms in far enough; without a source they are kept in a GrowingBuffer.
+    render() returns at most ~2 points per screen pixel for the requested time range: full resolution data when the
+    user zooms in far enough, min/max pairs of the coarsest sufficient level otherwise (peaks are never lost).
+    """
+    def __init__(self, factor: int = 8, source=None):
+        self.factor = factor
+        self.clear(source)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self, source=None):
+        self.source = source
+        self.data = GrowingBuffer(columns=2) if source is None else None
+        self.levels = []        # GrowingBuffer(time, min, max) with bucket sizes factor, factor**2, ...
+        self.pending = (np.empty(0), np.empty(0))   # points of the incomplete level 0 bucket
+        self.count = 0
+        self.first_time = self.last_time = 0.0
+
+    def extend(self, times, values):
+        times, values = np.asarray(times, dtype=np.float64), np.asarray(values, dtype=np.float64)
+        if not len(times):
+            return
+        if self.data is not None:
+            self.data.extend(times, values)
+        if not self.count:
+            self.first_time = float(times[0])
+        self.count += len(times)
+        self.last_time = float(times[-1])
+        times, values = np.concatenate((self.pending[0], times)), np.concatenate((self.pending[1], values))
+        complete = len(times) // self.factor * self.factor
+        self.pending = times[complete:].copy(), values[complete:].copy()
+        self._update_levels(times[:complete], values[:complete], values[:complete])
+
+    def load(self, times, values, chunk_size: int = 1 << 20):
+        # whole series at once, e.g. columns of a memory-mapped recording - read back from them, only levels are kept
+        self.clear(lambda start, stop: (times[start:stop], values[start:stop]))
+        for start in range(0, len(times), chunk_size):
+            self.extend(times[start:start + chunk_size], values[start:start + chunk_size])
+
+    def restore(self, levels, count: int, first_time: float, last_time: float, source):
+        # levels saved from another pyramid (arrays of time, min, max rows) of the series read through `source`
+        self.clear(source)
+        for level in levels:
+            self.levels.append(GrowingBuffer(columns=3, capacity=max(level.shape[1], 1)))
+            self.levels[-1].extend(*level)
+        self.count, self.first_time, self.last_time = count, float(first_time), float(last_time)
+        self.pending = self.read(count - count % self.factor, count)
+
+    def read(self, start: int, stop: int):
+        if self.data is not None:
+            times, values = self.data.view()
+            return times[start:stop], values[start:stop]
+        return self.source(start, stop)
+
+    def _update_levels(self, times, mins, maxs):
+        # complete buckets of full resolution points following the ones already summarized
+        level = 0
+        while len(times):
+            if level == len(self.levels):
+                self.levels.append(GrowingBuffer(columns=3))
+            summary = self.levels[level]
+            summary.extend(times[::self.factor], mins.reshape(-1, self.factor).min(axis=1),
+                           maxs.reshape(-1, self.factor).max(axis=1))
+            # complete buckets of this level not yet summarized in the next one
+            source_time, source_min, source_max = summary.view()
+            start = len(self.levels[level + 1]) * self.factor if level + 1 < len(self.levels) else 0
+            stop = len(source_time) // self.factor * self.factor
+            times, mins, maxs = source_time[start:stop], source_min[start:stop], source_max[start:stop]
+            level += 1
+
+    def bounds(self):
+        return self.first_time, self.last_time
+
+    def _index_range(self, x_min: float, x_max: float):
+        # indexes of the points in [x_min, x_max] plus at least one on each side, from the level 0 bucket times
+        if not self.levels:
+            return 0, self.count
+        bucket_times = self.levels[0].view()[0]
+        first = max(np.searchsorted(bucket_times, x_min, side='right') - 2, 0) * self.factor
+        last = np.searchsorted(bucket_times, x_max, side='right')
+        return first, self.count if last == len(bucket_times) else (last + 1) * self.factor
+
+    def render(self, x_min: float, x_max: float, pixels: int):
+        first, last = self._index_range(x_min, x_max)
+        if last - first <= 2 * pixels + 3 * self.factor:
+            times, values = self.read(first, last)      # zoomed in - full resolution
+            start, stop = np.searchsorted(times, [x_min, x_max])
+            start, stop = max(start - 1, 0), min(stop + 1, len(times))
+            return times[start:stop], values[start:stop]
+
+        level = 0
+        bucket = self.factor
+        while level + 1 < len(self.levels) and (last - first) / bucket > pixels:
+            level += 1
+            bucket *= self.factor
+        x, y = [], []
+        position = first // bucket * bucket
+        # buckets of the chosen level, then the newest points not summarized there from finer levels
+        while position < last:
+            bucket_times, bucket_min, bucket_max = self.levels[level].view()
+            stop = min(-(-last // bucket), len(bucket_times))
+            if stop > position // bucket:
+                x.append(np.repeat(bucket_times[position // bucket:stop], 2))
+                pairs = np.empty(len(x[-1]))
+                pairs[0::2] = bucket_min[position // bucket:stop]
+                pairs[1::2] = bucket_max[position // bucket:stop]
+                y.append(pairs)
+                position = stop * bucket
+            if not level:
+                break
+            level -= 1
+            bucket //= self.factor
+        if position < last:
+            times, values = self.read(position, last)     # less than one level 0 bucket
+            x.append(times)
+            y.append(values)
+        return np.concatenate(x), np.concatenate(y)
@@ -0,0 +1,310 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import datetime
+
+# record layout of the 'npy' format - numpy is imported only when it is used, CSV recording does not need it
+recording_fields = [('timestamp', '<f8'), ('mass', '<f8'), ('raw', '<i4'), ('status', 'u1')]
+
+# 'wdt' format: fixed size header, then packed little endian records of wdt_fields (17 bytes per sample)
+#   0  6 bytes  magic b'WDTREC'
+#   6  uint16   format version
+#   8  uint32   offset of the first record (= header size, 4096)
+#  12  JSON     device configuration and calibration, UTF-8, padded with spaces up to the first record
+wdt_magic = b'WDTREC'
+wdt_version = 1
+wdt_headerSize = 4096
+wdt_fields = [('timestamp', '<f8'), ('mass', '<f4'), ('raw', '<i4'), ('status', 'u1')]
+
+
+def status_toBits(oneBitsInfo: dict) -> int:
+    # discrete inputs packed in oneBitsReadRegisters order: bit 0 - input tara, 1 - overload, 2 - general error, ...
+    # (names in 'status_bits' of the wdt header)
+    return sum(1 << i for i, bit in enumerate(oneBitsInfo.values()) if bit)
+
+
+def sample_records(samples: list, fields):
+    import numpy as np
+    return np.array([(s.timestamp, s.mass, s.raw, status_toBits(s.oneBitsInfo)) for s in samples], dtype=fields)
+
+
+csv_header = "timestamp;time;mass;raw;status\n"
+
+
+def csv_line(sample) -> str:
+    return (f"{sample.timestamp:.6f};{datetime.fromtimestamp(sample.timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')};"
+            f"{sample.mass!r};{sample.raw};{status_toBits(sample.oneBitsInfo)}\n")
+
+
+class StreamRecorder:
+    """
+    Appends samples to a file while capturing, in chunks of chunk_size samples (or every flush_interval seconds),
+    so memory use stays constant for multi-hour recordings. Every chunk is flushed and fsync'ed - after a crash the
+    partial file is still readable up to the last complete chunk.
+    The file is written in the temporary directory (or directly to `path`), save() only moves (renames) it to its
+    final location.
+
+    Formats:
+        'csv' - semicolon separated text: timestamp;time;mass;raw;status
+        'npy' - sequence of .npy arrays (one per chunk) with recording_fields records, read by read_npyChunks()
+        'wdt' - header with the device configuration and calibration (`header`, see device_header()), then
+                fixed size wdt_fields records; opened with open_recording() as a numpy.memmap
+    """
+    extensions = {'csv': '.csv', 'npy': '.npy', 'wdt': '.wdt'}
+
+    def __init__(self, file_format='csv', chunk_size=256, flush_interval=1.0, directory=None, path=None, header=None):
+        if file_format not in self.extensions:
+            raise ValueError(f"Unsupported recording format: {file_format}")
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        if path is None:
+            descriptor, self.path = tempfile.mkstemp(suffix=self.extensions[file_format], prefix='recording_',
+                                                     dir=directory)
+            self.file = os.fdopen(descriptor, 'w' if file_format == 'csv' else 'wb')
+        else:
+            self.path = path
+            self.file = open(path, 'w' if file_format == 'csv' else 'wb')
+        self.chunk = []
+        self.count = 0
+        self.last_flush = time.perf_counter()
+        self.saved = False
+        self.header = dict(header or {})
+        if file_format == 'csv':
+            self.file.write(csv_header)
+        elif file_format == 'wdt':
+            self.header['started'] = datetime.now().isoformat()
+            self.file.write(wdt_header(self.header))
+
+    def append(self, samples: list):
+        if samples and self.file_format == 'wdt':
+            self.header.setdefault('status_bits', list(samples[0].oneBitsInfo))
+            self.track_samplingFrequency(samples)
+        self.chunk.extend(samples)
+        self.count += len(samples)
+        if len(self.chunk) >= self.chunk_size or time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def track_samplingFrequency(self, samples: list):
+        # device rate changes during the recording are kept in the header: [timestamp, samples/s] from that sample on
+        changes = self.header.setdefault('frequency_changes', [])
+        current = changes[-1][1] if changes else self.header.get('sampling_frequency')
+        for sample in samples:
+            frequency = sample.intInfo.get('Sampling frequency')
+            if frequency != current:
+                if len(changes) >= 100:     # the header has a fixed size
+                    self.header['frequency_changes_truncated'] = True
+                    return
+                changes.append([sample.timestamp, frequency])
+                current = frequency
+
+    def flush(self):
+        if self.chunk and not self.file.closed:
+            if self.file_format == 'csv':
+                self.file.writelines(csv_line(sample) for sample in self.chunk)
+            else:
+                records = sample_records(self.chunk, recording_fields if self.file_format == 'npy' else wdt_fields)
+                if self.file_format == 'npy':
+                    import numpy as np
+                    np.save(self.file, records)
+                else:
+                    self.file.write(records.tobytes())
+            self.file.flush()
+            try:
+                os.fsync(self.file.fileno())
+            except OSError:
+                pass    # pipes and devices (e.g. /dev/null) cannot be synced
+            self.chunk = []
+        self.last_flush = time.perf_counter()
+
+    def read(self, start: int, stop: int):
+        # records start:stop of a 'wdt' recording in progress - flushed ones from the file, the rest from the chunk
+        import numpy as np
+        if self.file_format != 'wdt':
+            raise ValueError(f"Reading back is not supported for {self.file_format} recordings")
+        dtype = np.dtype(wdt_fields)
+        flushed = self.count - len(self.chunk)
+        stop = min(stop, self.count)
+        parts = []
+        if start < min(stop, flushed):
+            parts.append(np.fromfile(self.path, dtype=dtype, count=min(stop, flushed) - start,
+                                     offset=wdt_headerSize + start * dtype.itemsize))
+        if stop > flushed:
+            parts.append(sample_records(self.chunk[max(start - flushed, 0):stop - flushed], wdt_fields))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            if self.file_format == 'wdt' and self.file.seekable():
+                # final sample count in the header - readers still rely on the file size (interrupted recordings)
+                self.header.update(count=self.count, stopped=datetime.now().isoformat())
+                self.file.seek(0)
+                self.file.write(wdt_header(self.header))
+            self.file.close()
+
+    def save(self, fileName: str) -> str:
+        self.close()
+        # a rename when the destination is on the same filesystem, copy + delete otherwise
+        shutil.move(self.path, fileName)
+        self.path = fileName
+        self.saved = True
+        return fileName
+
+    def discard(self):
+        # removes the temporary file of a recording that was not saved
+        self.close()
+        if not self.saved and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def device_header(modbusClient, raw_tare=0, **extra) -> dict:
+    # configuration and calibration needed to interpret a recording later
+    return dict(unit=modbusClient.unit, sampling_frequency=modbusClient.intInfo['Sampling frequency'],
+                sensor_capacity=modbusClient.intInfo['Sensor capacity'],
+                rated_output=modbusClient.realInfo['Real rated output'], mV_scale=modbusClient.mV_scale,
+                mass_scaleFromRaw=modbusClient.mass_scaleFromRaw,
+                maximum_raw_signal=modbusClient.maximum_raw_signal, raw_tare=raw_tare,
+                status_bits=list(modbusClient.oneBitsInfo), **extra)
+
+
+def wdt_header(header: dict) -> bytes:
+    text = json.dumps(dict(header, fields=[list(field) for field in wdt_fields])).encode()
+    prefix = wdt_magic + struct.pack('<HI', wdt_version, wdt_headerSize)
+    if len(prefix) + len(text) > wdt_headerSize:
+        raise ValueError(f"Recording header longer than {wdt_headerSize} bytes")
+    return prefix + text.ljust(wdt_headerSize - len(prefix))
+
+
+def read_wdtHeader(path: str):
+    # returns (header dict, offset of the first record)
+    with open(path, 'rb') as file:
+        prefix = file.read(12)
+        if len(prefix) < 12 or prefix[:6] != wdt_magic:
+            raise ValueError(f"{path} is not a WDT recording")
+        version, offset = struct.unpack('<HI', prefix[6:])
+        if version > wdt_version:
+            raise ValueError(f"Unsupported recording version {version}")
+        return json.loads(file.read(offset - 12).decode()), offset
+
+
+def open_recording(path: str):
+    """
+    Returns (header, records) of a 'wdt' or 'npy' recording, records have timestamp, mass, raw and status fields.
+    'wdt' records are a read-only numpy.memmap - nothing is read until it is used, so multi-GB recordings open
+    instantly. A partial last record (interrupted recording) is ignored.
+    """
+    import numpy as np
+    if path.endswith(StreamRecorder.extensions['npy']):
+        return {}, read_npyChunks(path)
+    header, offset = read_wdtHeader(path)
+    dtype = np.dtype(wdt_fields)
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if not count:
+        return header, np.empty(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+
+def summary_path(path: str) -> str:
+    return path + '.summary.npz'
+
+
+def save_summary(path: str, pyramid, stats):
+    # plot levels and statistics of a recording stored next to it, so it reopens without reading all records
+    import numpy as np
+    levels = {f"level{i}": np.stack(level.view()) for i, level in enumerate(pyramid.levels)}
+    with open(summary_path(path), 'wb') as file:
+        np.savez(file, count=pyramid.count, factor=pyramid.factor, bounds=pyramid.bounds(),
+                 stats=json.dumps(stats.state()), **levels)
+
+
+def load_summary(path: str, records, pyramid, stats) -> bool:
+    # restores the saved summary of `records` (from open_recording), False if there is none or it is out of date
+    import numpy as np
+    try:
+        with np.load(summary_path(path)) as summary:
+            if int(summary['count']) != len(records) or int(summary['factor']) != pyramid.factor:
+                return False
+            levels = [summary[f"level{i}"] for i in range(len(summary.files) - 4)]
+            bounds, state = summary['bounds'], json.loads(str(summary['stats']))
+    except (OSError, KeyError, ValueError):
+        return False
+    pyramid.restore(levels, len(records), *bounds,
+                    source=lambda start, stop: (records['timestamp'][start:stop], records['mass'][start:stop]))
+    stats.restore(state)
+    return True
+
+
+def build_summary(path: str, records, pyramid, stats, chunk_size: int = 1 << 20):
+    # plot levels and statistics over all records (slow for long recordings - run it off the GUI thread), saved
+    pyramid.load(records['timestamp'], records['mass'], chunk_size)
+    stats.reset()
+    for start in range(0, len(records), chunk_size):    # in chunks - a memory-mapped recording may not fit in RAM
+        chunk = records[start:start + chunk_size]
+        stats.extend(chunk['timestamp'], chunk['mass'])
+    try:
+        save_summary(path, pyramid, stats)
+    except OSError as error:
+        print(f"Summary of {path} not saved: {error}")
+
+
+def export_recording(path: str, output: str, chunk_size: int = 1 << 20) -> int:
+    """
+    Converts a recording to CSV (same columns as the 'csv' format) or, with pyarrow installed, to Parquet - chosen by
+    the extension of `output`. Columns keep the precision of the recording (float32 mass of 'wdt', float64 of 'npy').
+    Written chunk by chunk, memory use does not depend on the recording length. Returns the number of exported samples.
+    """
+    import numpy as np
+    header, records = open_recording(path)
+    if output.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        fields = [(name, records.dtype[name]) for name in records.dtype.names]
+        schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in fields],
+                           metadata={'recording': json.dumps(header)})
+        with pq.ParquetWriter(output, schema) as writer:
+            for start in range(0, len(records), chunk_size):
+                chunk = records[start:start + chunk_size]
+                writer.write_table(pa.Table.from_arrays([np.ascontiguousarray(chunk[name]) for name, dtype in fields],
+                                                        schema=schema))
+        return len(records)
+
+    # float32 masses have ~7 significant digits, float64 ones are written as the 'csv' format does (repr)
+    mass_format = '{:.7g}'.format if records.dtype['mass'].itemsize == 4 else repr
+    with open(output, 'w') as file:
+        file.write(csv_header)
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            times = chunk['timestamp']
+            # local time, shifted by the UTC offset at the start of the chunk (as datetime.fromtimestamp does)
+            utc_offset = datetime.fromtimestamp(times[0]).astimezone().utcoffset().total_seconds()
+            dates = np.datetime_as_string(((times + utc_offset) * 1e6).astype('datetime64[us]'), unit='us')
+            file.writelines(f"{t:.6f};{d.replace('T', ' ')};{mass_format(m)};{r};{s}\n" for t, d, m, r, s in
+                            zip(times.tolist(), dates.tolist(), chunk['mass'].tolist(), chunk['raw'].tolist(),
+                                chunk['status'].tolist()))
+    return len(records)
+
+
+def read_npyChunks(path: str):
+    # concatenates all complete chunks, an incomplete last chunk (interrupted recording) is ignored
+    import numpy as np
+    chunks = []
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                chunks.append(np.load(file))
+            except (EOFError, ValueError):
+                break
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=recording_fields)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Export a recording to CSV or Parquet")
+    parser.add_argument('recording', help="'wdt' or 'npy' recording")
+    parser.add_argument('output', help="output .csv or .parquet file")
+    args = parser.parse_args()
+    print(f"{export_recording(args.recording, args.output)} samples exported to {args.output}")
@@ -0,0 +1,133 @@
+import math
+from collections import deque
+
+import numpy as np
+
+
+class RunningStats:
+    """
+    Statistics of a recording updated in O(1) per sample: count, min, max, mean and variance (Welford's algorithm)
+    and duration from numeric (epoch) timestamps.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.first_time = None
+        self.last_time = None
+
+    def update(self, timestamp: float, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = timestamp
+
+    def extend(self, timestamps, values):
+        # whole batch at once (numpy arrays), merged with the statistics so far (Chan et al. parallel variance)
+        count = len(values)
+        if not count:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        delta = mean - self.mean
+        total = self.count + count
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.first_time is None:
+            self.first_time = float(timestamps[0])
+        self.last_time = float(timestamps[-1])
+
+    def state(self) -> dict:
+        return dict(vars(self))
+
+    def restore(self, state: dict):
+        self.__dict__.update(state)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def duration(self) -> float:
+        return self.last_time - self.first_time if self.count else 0.0
+
+
+class WindowedStats:
+    """
+    Statistics over the last `window` seconds. Mean and variance are updated on insert/evict (Welford's algorithm
+    run forwards and backwards - plain sums of squares cancel catastrophically at a large mass and a small noise),
+    min and max are kept in monotonic deques, so every sample is added and removed once - O(1) amortized per sample.
+    """
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.samples = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = deque()     # increasing values, candidates for minimum
+        self._max = deque()     # decreasing values, candidates for maximum
+
+    def update(self, timestamp: float, value: float):
+        self.samples.append((timestamp, value))
+        delta = value - self._mean
+        self._mean += delta / len(self.samples)
+        self._m2 += delta * (value - self._mean)
+        while self._min and self._min[-1][1] > value:
+            self._min.pop()
+        self._min.append((timestamp, value))
+        while self._max and self._max[-1][1] < value:
+            self._max.pop()
+        self._max.append((timestamp, value))
+
+        oldest_allowed = timestamp - self.window
+        while self.samples[0][0] < oldest_allowed:
+            old_time, old_value = self.samples.popleft()
+            delta = old_value - self._mean
+            self._mean -= delta / len(self.samples)
+            self._m2 -= delta * (old_value - self._mean)
+            if self._min[0][0] <= old_time:
+                self._min.popleft()
+            if self._max[0][0] <= old_time:
+                self._max.popleft()
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    @property
+    def min(self) -> float:
+        return self._min[0][1] if self._min else math.nan
+
+    @property
+    def max(self) -> float:
+        return self._max[0][1] if self._max else math.nan
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.count else math.nan
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(self._m2 / (self.count - 1), 0.0))
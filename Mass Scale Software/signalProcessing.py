@@ -0,0 +1,250 @@
+"""
+Streaming processing of the raw signal on the host, vectorized over the sample batches delivered by SampleBus.
+
+Every stage keeps only the state it needs to continue with the next batch (the last window of input samples, the
+last output value, ...), so a signal split into batches gives the same output as the whole signal at once:
+    - MovingAverage, MovingMedian and ExponentialMovingAverage filters,
+    - StabilityDetector - standard deviation over a window of samples below a threshold for at least settle_time,
+    - PeakCapture - peak value and plateaus (mean value of every stable period),
+    - SignalPipeline - raw signal -> filter -> mass (tare, scale) -> stability -> capture, fed with Samples.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+Plateau = namedtuple('Plateau', ['start', 'end', 'mean', 'count'])
+Processed = namedtuple('Processed', ['times', 'mass', 'stable'])
+
+
+class MovingAverage:
+    # mean of the last `size` samples, the first outputs average over the samples received so far
+    def __init__(self, size: int = 10):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)      # last size - 1 input samples
+
+    def process(self, values) -> np.ndarray:
+        values = np.concatenate((self.history, np.asarray(values, dtype=float)))
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        ends = np.arange(len(self.history) + 1, len(values) + 1)
+        starts = np.maximum(ends - self.size, 0)
+        self.history = values[len(values) - min(self.size - 1, len(values)):]
+        return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+class MovingMedian:
+    # median of the last `size` samples - removes single sample spikes without smearing steps
+    def __init__(self, size: int = 5):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)
+
+    def process(self, values) -> np.ndarray:
+        new = len(values)
+        values = np.concatenate((self.history, np.asarray(values, dtype=float)))
+        output = np.empty(new)
+        warmup = max(min(self.size - 1 - len(self.history), new), 0)
+        for i in range(warmup):     # first samples of the signal only
+            output[i] = np.median(values[:len(self.history) + i + 1])
+        if new > warmup:
+            output[warmup:] = np.median(sliding_window_view(values, self.size)[-(new - warmup):], axis=1)
+        self.history = values[len(values) - min(self.size - 1, len(values)):]
+        return output
+
+
+class ExponentialMovingAverage:
+    """
+    y[n] = alpha * x[n] + (1 - alpha) * y[n - 1], started at the first sample.
+    Vectorized as y[n] = d**(n + 1) * (y[-1] + alpha * cumsum(x[j] / d**(j + 1))) with d = 1 - alpha, in chunks short
+    enough for d**-n to stay well inside the float range.
+    """
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.reset()
+
+    @classmethod
+    def from_timeConstant(cls, time_constant: float, sampling_frequency: float):
+        return cls(1 - math.exp(-1 / (time_constant * sampling_frequency)))
+
+    def reset(self):
+        self.last = None
+
+    def process(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values
+        decay = 1 - self.alpha
+        if decay <= 0:
+            self.last = values[-1]
+            return values.copy()
+        if self.last is None:
+            self.last = values[0]
+        chunk = max(int(27 / -math.log(decay)), 1)     # decay**-chunk <= ~5e11
+        output = np.empty(len(values))
+        for start in range(0, len(values), chunk):
+            x = values[start:start + chunk]
+            powers = decay ** np.arange(1, len(x) + 1)
+            output[start:start + len(x)] = powers * (self.last + self.alpha * np.cumsum(x / powers))
+            self.last = output[start + len(x) - 1]
+        return output
+
+
+class StabilityDetector:
+    """
+    Host side stability: a sample is stable when the standard deviation of the last `size` samples is at most
+    `threshold` and has been so continuously for at least `settle_time` seconds. Until `size` samples have arrived
+    the signal is unstable. With `window` [s] the standard deviation is taken over the samples of the last `window`
+    seconds instead - independent of the rate the samples actually arrive at - and the signal is unstable until
+    a whole window has been seen.
+    """
+    def __init__(self, size: int = 50, threshold: float = 0.5, settle_time: float = 0.5, window: float = None):
+        self.size = size
+        self.window = window
+        self.threshold = threshold
+        self.settle_time = settle_time
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)
+        self.history_times = np.empty(0)
+        self.first_time = None
+        self.calm_since = None      # time the current calm period started, None if the last sample was not calm
+        self.std = math.nan
+        self.stable = False
+
+    def process(self, times, values) -> np.ndarray:
+        times = np.asarray(times, dtype=float)
+        new = len(times)
+        if not new:
+            return np.zeros(0, dtype=bool)
+        values = np.concatenate((self.history, np.asarray(values, dtype=float)))
+        if self.first_time is None:
+            self.first_time = times[0]
+        centered = values - values[0]       # sums of squares of small numbers - less cancellation
+        sums = np.concatenate(([0.0], np.cumsum(centered)))
+        squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+        ends = np.arange(len(values) - new + 1, len(values) + 1)
+        if self.window is None:
+            starts = np.maximum(ends - self.size, 0)
+            full = ends - starts >= self.size
+        else:
+            all_times = np.concatenate((self.history_times, times))
+            starts = np.searchsorted(all_times, times - self.window)
+            full = (times - self.first_time >= self.window) & (ends - starts >= 2)
+        counts = ends - starts
+        window_sum = sums[ends] - sums[starts]
+        variance = (squares[ends] - squares[starts] - window_sum * window_sum / counts) / np.maximum(counts - 1, 1)
+        std = np.sqrt(np.maximum(variance, 0.0))
+        calm = full & (std <= self.threshold)
+
+        # start time of the calm period every sample belongs to
+        index = np.arange(new)
+        run_start = np.maximum.accumulate(np.where(calm, -1, index)) + 1
+        since = times[np.minimum(run_start, new - 1)]
+        if self.calm_since is not None:
+            since[run_start == 0] = self.calm_since
+        stable = calm & (times - since >= self.settle_time)
+
+        self.calm_since = since[-1] if calm[-1] else None
+        if self.window is None:
+            self.history = values[len(values) - min(self.size - 1, len(values)):]
+        else:
+            kept = np.searchsorted(all_times, times[-1] - self.window)
+            self.history, self.history_times = values[kept:], all_times[kept:]
+        self.std = float(std[-1]) if counts[-1] >= 2 else math.nan
+        self.stable = bool(stable[-1])
+        return stable
+
+
+class PeakCapture:
+    # highest value of the signal and plateaus - mean value and span of every stable period
+    def __init__(self, max_plateaus: int = 1000):
+        self.max_plateaus = max_plateaus
+        self.reset()
+
+    def reset(self):
+        self.peak = -math.inf
+        self.peak_time = None
+        self.plateaus = []          # completed plateaus, oldest first
+        self._run = None            # [start, end, sum, count] of the current stable period
+
+    def process(self, times, values, stable):
+        times, values = np.asarray(times, dtype=float), np.asarray(values, dtype=float)
+        stable = np.asarray(stable, dtype=bool)
+        if not len(values):
+            return
+        top = int(np.argmax(values))
+        if values[top] > self.peak:
+            self.peak, self.peak_time = float(values[top]), float(times[top])
+
+        # loop over the stable / unstable segments of the batch, not over samples
+        edges = np.flatnonzero(np.diff(stable.astype(np.int8))) + 1
+        for start, stop in zip(np.concatenate(([0], edges)), np.concatenate((edges, [len(values)]))):
+            if stable[start]:
+                if self._run is None:
+                    self._run = [float(times[start]), 0.0, 0.0, 0]
+                self._run[1] = float(times[stop - 1])
+                self._run[2] += float(values[start:stop].sum())
+                self._run[3] += int(stop - start)
+            elif self._run is not None:
+                self._close_run()
+
+    def _close_run(self):
+        start, end, total, count = self._run
+        self.plateaus.append(Plateau(start, end, total / count, count))
+        del self.plateaus[:-self.max_plateaus]
+        self._run = None
+
+    @property
+    def plateau(self) -> float:
+        # mean of the current stable period, or of the last completed one
+        if self._run is not None:
+            return self._run[2] / self._run[3]
+        return self.plateaus[-1].mean if self.plateaus else math.nan
+
+
+class SignalPipeline:
+    """
+    Mass, stability and plateaus computed on the host from the raw signal of Samples (one unit).
+    The raw signal is filtered first (all filters are linear or order based), so changing the raw tare or scale
+    takes effect immediately without a filter transient.
+    """
+    filters = {'none': None, 'average': MovingAverage, 'median': MovingMedian, 'ema': ExponentialMovingAverage}
+
+    def __init__(self, scale: float, tare: int = 0, filter='average', stability=None, capture=None):
+        self.scale = scale          # grams per raw signal unit
+        self.tare = tare            # raw signal of the empty scale
+        if isinstance(filter, str):
+            filter = self.filters[filter]() if self.filters[filter] else None
+        self.filter = filter
+        self.stability = stability if stability is not None else StabilityDetector()
+        self.capture = capture if capture is not None else PeakCapture()
+        self.mass = math.nan        # last filtered mass
+
+    def reset(self):
+        for stage in (self.filter, self.stability, self.capture):
+            if stage is not None:
+                stage.reset()
+        self.mass = math.nan
+
+    def process(self, samples: list) -> Processed:
+        times = np.fromiter((s.timestamp for s in samples), dtype=float, count=len(samples))
+        raw = np.fromiter((s.raw for s in samples), dtype=float, count=len(samples))
+        if self.filter is not None:
+            raw = self.filter.process(raw)
+        mass = (raw - self.tare) * self.scale
+        stable = self.stability.process(times, mass)
+        self.capture.process(times, mass, stable)
+        if len(mass):
+            self.mass = float(mass[-1])
+        return Processed(times, mass, stable)
+
+    @property
+    def stable(self) -> bool:
+        return self.stability.stable
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the application modules are flat files next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wdtSimulator import WDT11Simulator  # noqa: E402
+
+
+@pytest.fixture
+def simulator():
+    # instant responses, constant load - values can be compared exactly
+    return WDT11Simulator(waveform='constant', mass=250.0, noise=0.0, line_timing=False, seed=0)
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from acquisition import PollScheduler, auto_frequency
+from modbusConnection import ModbusClient
+from wdtSimulator import WDT11Simulator, SimulatedBus
+
+
+@pytest.fixture
+def scheduler():
+    simulators = [WDT11Simulator(unit=unit, waveform='constant', mass=100.0 * unit, noise=0.0, line_timing=False)
+                  for unit in (1, 2)]
+    primary = ModbusClient(method='rtu', port='simulator', timeout=0.2, unit=1,
+                           transport=SimulatedBus(simulators).loopback)
+    primary.connect()
+    clients = [primary, ModbusClient(method='rtu', port='simulator', timeout=0.2, unit=2, bus=primary)]
+    scheduler = PollScheduler(clients)
+    yield scheduler
+    scheduler.stop(timeout=2)
+
+
+def test_units_on_one_bus_share_a_worker(scheduler):
+    assert len(scheduler.workers) == 1
+    scheduler.start()
+    time.sleep(0.3)
+    scheduler.stop(timeout=2)
+    masses = {sample.unit: sample.mass for sample in scheduler.drain_all()}
+    assert masses == {1: pytest.approx(100, abs=0.2), 2: pytest.approx(200, abs=0.2)}     # one raw step
+    assert scheduler.errors == 0
+
+
+@pytest.mark.parametrize('unit, tared', [(None, {1, 2}), (2, {2})])
+def test_tare_reaches_the_requested_units(scheduler, unit, tared):
+    scheduler.start()
+    time.sleep(0.2)
+    scheduler.send_request(tare=True, unit=unit)
+    time.sleep(0.3)
+    scheduler.stop(timeout=2)
+    masses = {sample.unit: sample.mass for sample in scheduler.drain_all()}
+    assert {unit for unit, mass in masses.items() if abs(mass) < 1e-3} == tared
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_auto_frequency_follows_the_first_measured_poll(asynchronous):
+    simulator = WDT11Simulator(line_timing=True, turnaround=0.05)
+    if asynchronous:
+        from asyncModbus import AsyncModbusClient, AsyncAcquisitionWorker
+        client = AsyncModbusClient('simulator', timeout=0.5, open_connection=simulator.open_connection)
+        scheduler = PollScheduler([client], worker=AsyncAcquisitionWorker)
+    else:
+        client = ModbusClient(method='rtu', port='simulator', timeout=0.5, transport=simulator.loopback)
+        client.connect()
+        scheduler = PollScheduler([client])
+    scheduler.set_samplingFrequency('auto')
+    scheduler.start()
+    time.sleep(0.6)
+    scheduler.stop(timeout=2)
+    worker, = scheduler.workers
+    assert worker.pollTime is not None and not worker.deferred
+    assert simulator.sampling_frequency == auto_frequency(worker.pollTime) < 123
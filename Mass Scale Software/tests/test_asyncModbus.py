@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+from pymodbus.exceptions import ModbusIOException, InvalidMessageReceivedException
+
+from acquisition import PollScheduler
+from asyncModbus import AsyncModbusClient, AsyncAcquisitionWorker
+from wdtSimulator import WDT11Simulator, SimulatedBus
+
+
+def test_poll_over_open_connection(simulator):
+    client = AsyncModbusClient('simulator', timeout=0.2, open_connection=simulator.open_connection)
+
+    async def poll():
+        result = await client.poll()
+        await client.close()
+        return result
+    intInfo, realInfo, oneBitsInfo = asyncio.run(poll())
+    assert realInfo['Actual mass'] == pytest.approx(simulator.actual_mass, abs=1e-3)
+    assert intInfo['Sampling frequency'] == 123
+    assert not client.failedBlocks
+
+
+def test_failed_sample_block_raises(simulator):
+    client = AsyncModbusClient('simulator', timeout=0.05, retries=0, open_connection=simulator.open_connection)
+
+    async def poll_with_lost_inputs():
+        await client.poll()
+        read_block = client.read_block
+
+        async def failing(block):
+            if block.function == 'discrete':
+                raise ModbusIOException("no response")
+            return await read_block(block)
+        client.read_block = failing
+        try:
+            await client.poll()
+        finally:
+            await client.close()
+    with pytest.raises(ModbusIOException):
+        asyncio.run(poll_with_lost_inputs())
+    assert [block.function for block in client.failedBlocks] == ['discrete']
+
+
+def test_worker_polls_every_unit_and_tares_all():
+    simulators = [WDT11Simulator(unit=unit, waveform='constant', mass=100.0 * unit, noise=0.0, line_timing=False)
+                  for unit in (1, 2)]
+    bus = SimulatedBus(simulators)
+    primary = AsyncModbusClient('simulator', timeout=0.2, unit=1, open_connection=bus.open_connection)
+    clients = [primary, AsyncModbusClient('simulator', timeout=0.2, unit=2, bus=primary)]
+    scheduler = PollScheduler(clients, worker=AsyncAcquisitionWorker)
+    assert len(scheduler.workers) == 1
+    scheduler.start()
+    time.sleep(0.3)
+    scheduler.send_request(tare=True)
+    time.sleep(0.3)
+    scheduler.stop(timeout=2)
+    samples = scheduler.drain_all()
+    assert {sample.unit for sample in samples} == {1, 2}
+    assert scheduler.errors == 0
+    newest = {sample.unit: sample.mass for sample in samples}
+    assert newest == {1: pytest.approx(0.0, abs=1e-3), 2: pytest.approx(0.0, abs=1e-3)}
+
+
+def test_slow_device_backs_off_and_late_responses_are_rejected():
+    slow = WDT11Simulator(waveform='constant', mass=250.0, noise=0.0, turnaround=0.06)
+    client = AsyncModbusClient('simulator', timeout=1.0, open_connection=slow.open_connection)
+
+    async def poll(count):
+        results = [await client.poll() for _ in range(count)]
+        await client.close()
+        return results
+    for intInfo, realInfo, oneBitsInfo in asyncio.run(poll(10)):
+        assert realInfo['Actual mass'] == pytest.approx(250, abs=0.2)
+    assert client.turnaround == pytest.approx(0.06, abs=0.02)
+    assert client.backoff == 1
+    assert client.metrics.errors['timeout'] <= 2
+
+
+def test_response_must_match_the_request():
+    client = AsyncModbusClient('simulator')
+    request = client.encode(0x03, bytes(4))
+    answer = client.encode(0x02, bytes([1, 0]))
+    with pytest.raises(InvalidMessageReceivedException):
+        client.check_response(request, answer, 7)
+    answer = client.encode(0x03, bytes([2, 0, 0]))
+    client.check_response(request, answer, 7)
+    with pytest.raises(InvalidMessageReceivedException):
+        client.check_response(request, answer, 9)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from dataBuffers import RingBuffer
+
+
+def filled(capacity, count):
+    buffer = RingBuffer(capacity)
+    for i in range(count):
+        buffer.append(i, 10.0 * i)
+    return buffer
+
+
+def test_ring_buffer_keeps_the_newest_points_in_order():
+    buffer = filled(5, 13)
+    x, y = buffer.view()
+    np.testing.assert_array_equal(x, [8, 9, 10, 11, 12])
+    np.testing.assert_array_equal(y, 10 * x)
+    assert len(buffer) == 5
+    assert np.shares_memory(x, buffer.x)        # views, not copies
+
+
+def test_extend_matches_append():
+    appended, extended = filled(7, 20), RingBuffer(7)
+    for start, stop in ((0, 3), (3, 4), (4, 15), (15, 20)):
+        extended.extend(np.arange(start, stop), 10.0 * np.arange(start, stop))
+    for expected, actual in zip(appended.view(), extended.view()):
+        np.testing.assert_array_equal(expected, actual)
+    extended.extend(np.arange(100), np.arange(100))     # more than the capacity at once
+    np.testing.assert_array_equal(extended.view()[0], np.arange(93, 100))
+
+
+def test_window_by_timestamp():
+    buffer = filled(100, 30)
+    x, y = buffer.window(5)
+    np.testing.assert_array_equal(x, np.arange(24, 30))
+    assert len(RingBuffer(10).window(5)[0]) == 0
+
+
+def test_resize_and_clear():
+    buffer = filled(10, 25)
+    buffer.resize(4)
+    np.testing.assert_array_equal(buffer.view()[0], [21, 22, 23, 24])
+    buffer.resize(8)
+    buffer.append(25, 250.0)
+    np.testing.assert_array_equal(buffer.view()[0], [21, 22, 23, 24, 25])
+    buffer.clear()
+    assert len(buffer) == 0 and len(buffer.view()[0]) == 0
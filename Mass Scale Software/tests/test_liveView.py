@@ -0,0 +1,68 @@
+import pytest
+
+from acquisition import Sample
+from liveView import LiveViewModel
+from modbusConnection import ModbusClient
+
+
+class Widget:
+    def __init__(self, writes):
+        self.writes = writes
+        self.value = None
+
+    def setText(self, value):
+        self.writes.append(value)
+        self.value = value
+
+    setValue = setChecked = setText
+
+
+class View:
+    # any widget name, created on first use, every setter call is logged
+    def __init__(self):
+        self.writes = []
+
+    def __getattr__(self, name):
+        widget = Widget(self.writes)
+        setattr(self, name, widget)
+        return widget
+
+
+@pytest.fixture
+def sample(simulator):
+    client = ModbusClient(method='rtu', port='simulator', timeout=0.5, transport=simulator.loopback)
+    client.connect()
+    intInfo, realInfo, oneBitsInfo = client.poll()
+    client.close()
+    return client, Sample(0.0, realInfo['Actual mass'], intInfo['Current RAW signal'], dict(intInfo), dict(realInfo),
+                          dict(oneBitsInfo))
+
+
+def test_first_render_writes_every_widget(sample):
+    client, newest = sample
+    view = View()
+    liveView = LiveViewModel(view, client)
+    assert liveView.render(newest) == len(liveView.state(newest)) == len(view.writes)
+    assert view.actualMass.value == "250.0 g" and view.stabilityBtn.value is False
+
+
+def test_unchanged_inputs_are_skipped_and_changes_write_only_their_widgets(sample):
+    client, newest = sample
+    view = View()
+    liveView = LiveViewModel(view, client)
+    liveView.render(newest)
+    assert liveView.render(newest._replace(timestamp=1.0)) == 0
+    changed = newest._replace(mass=251.25, realInfo=dict(newest.realInfo, **{'Actual mass': 251.25}))
+    assert liveView.render(changed) == 1
+    assert view.actualMass.value == "251.2 g"
+    liveView.precision = 2
+    assert liveView.render(changed) == 1
+    assert view.actualMass.value == "251.25 g"
+
+
+def test_invalidate_writes_everything_again(sample):
+    client, newest = sample
+    liveView = LiveViewModel(View(), client)
+    written = liveView.render(newest)
+    liveView.invalidate()
+    assert liveView.render(newest) == written
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import massScaleCli
+from recorder import open_recording, csv_header
+
+
+def test_streams_csv_to_stdout(capsys):
+    assert massScaleCli.main(['--simulate', '--duration', '0.3', '--report-interval', '60']) == 0
+    out, err = capsys.readouterr()
+    lines = out.splitlines(keepends=True)
+    assert lines[0] == csv_header and len(lines) > 2
+    assert 'errors 0, dropped 0' in err.splitlines()[-1]
+
+
+@pytest.mark.parametrize('extra', [[], ['--async']])
+def test_records_every_unit_to_a_file(tmp_path, capsys, extra):
+    output = str(tmp_path / 'scales.wdt')
+    argv = ['--simulate', '--units', '1', '2', '--duration', '0.5', '--output', output, '--format', 'wdt']
+    assert massScaleCli.main(argv + extra) == 0
+    header, records = open_recording(output)
+    assert header['units'] == [1, 2]
+    assert header['count'] == len(records) > 2
+
+
+def test_headless_imports_no_gui_modules():
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.run([sys.executable, '-c', "import sys, massScaleCli; "
+                             "print(sorted({'PyQt6', 'pyqtgraph', 'pandas'} & set(sys.modules)))"],
+                            cwd=directory, capture_output=True, text=True, check=True).stdout
+    assert loaded.strip() == '[]'
+
+
+def test_silent_device_fails_cleanly(monkeypatch, capsys):
+    from modbusConnection import ModbusClient
+    from wdtSimulator import WDT11Simulator
+    silent = WDT11Simulator(timeout_rate=1.0, line_timing=False)
+    monkeypatch.setattr(massScaleCli, 'build_clients', lambda args: [
+        ModbusClient(method='rtu', port=args.port, timeout=0.05, transport=silent.loopback)])
+    assert massScaleCli.main(['--port', 'COM9', '--timeout', '0.05']) == 1
+    assert capsys.readouterr().err.startswith("Connection to COM9 failed: ")
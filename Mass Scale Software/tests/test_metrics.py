@@ -0,0 +1,55 @@
+import json
+import threading
+
+import pytest
+
+from metrics import LatencyHistogram, ModbusMetrics, MetricsFile
+
+
+def test_histogram_percentiles_are_bucket_edges():
+    histogram = LatencyHistogram()
+    for seconds in [0.002] * 90 + [0.05] * 9 + [3.0]:
+        histogram.record(seconds)
+    assert histogram.count == 100
+    assert histogram.mean == pytest.approx((0.18 + 0.45 + 3.0) / 100)
+    assert 0.002 <= histogram.percentile(50) < 0.002 * 10 ** 0.25
+    assert 0.05 <= histogram.percentile(95) < 0.05 * 10 ** 0.25
+    assert histogram.percentile(100) == histogram.max == 3.0
+    assert sum(histogram.snapshot()['buckets'].values()) == 100
+
+
+def test_metrics_count_errors_per_kind():
+    metrics = ModbusMetrics()
+    metrics.record(0x03, 0.01)
+    metrics.record(0x03, 0.2, 'timeout')
+    metrics.record(0x02, 0.01, 'crc')
+    snapshot = metrics.snapshot()
+    assert snapshot['transactions'] == 3
+    assert snapshot['errors'] == {'timeout': 1, 'crc': 1, 'exception': 0, 'other': 0}
+    assert snapshot['latency']['fc03']['count'] == 2 and snapshot['latency']['fc02']['count'] == 1
+
+
+def test_snapshot_while_function_codes_are_added():
+    metrics, done = ModbusMetrics(), threading.Event()
+
+    def acquisition():
+        for code in range(20000):
+            metrics.record(code, 0.001)
+        done.set()
+    thread = threading.Thread(target=acquisition)
+    thread.start()
+    while not done.is_set():
+        metrics.snapshot()
+    thread.join()
+    assert len(metrics.snapshot()['latency']) == 20000
+
+
+def test_metrics_file_writes_json_lines(tmp_path):
+    metrics = ModbusMetrics()
+    metrics.record(0x03, 0.01)
+    output = MetricsFile(str(tmp_path / 'metrics.jsonl'), interval=60)
+    assert not output.update(metrics.snapshot)
+    assert output.update(metrics.snapshot, force=True)
+    with open(output.path) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 1 and lines[0]['transactions'] == 1 and 'time' in lines[0]
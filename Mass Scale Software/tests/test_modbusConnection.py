@@ -0,0 +1,69 @@
+import pytest
+
+from modbusConnection import ModbusClient, build_pollPlan, read_throughGap, registerMap, \
+    intAddresses, realAddresses, oneBitsReadRegisters
+
+
+def covered(plan):
+    return {key for block in plan for info, key, offset, width in block.fields}
+
+
+def test_pollPlan_coalesces_the_register_map():
+    plan = build_pollPlan()
+    assert [(block.function, block.address, block.count) for block in plan] == [('holding', 0, 30),
+                                                                                ('discrete', 5000, 4)]
+    assert covered(plan) == set(registerMap)
+
+
+def test_pollPlan_without_gaps_reads_every_value():
+    plan = build_pollPlan(max_gap=-1)
+    assert len(plan) == len(intAddresses) + len(realAddresses) + len(oneBitsReadRegisters)
+    assert all(len(block.fields) == 1 for block in plan)
+
+
+def test_pollPlan_field_offsets():
+    block, = build_pollPlan(int_fields={'Sampling frequency': 12}, real_fields={'Actual mass': 20}, bit_fields={},
+                            max_gap=8)
+    assert (block.address, block.count) == (12, 10)
+    assert ('realInfo', 'Actual mass', 8, 2) in block.fields
+
+
+def test_read_throughGap_grows_with_the_baudrate():
+    assert read_throughGap(9600) < read_throughGap(19200) < read_throughGap(115200)
+    assert read_throughGap(19200, parity='E') <= read_throughGap(19200)
+
+
+@pytest.fixture
+def client(simulator):
+    client = ModbusClient(method='rtu', port='simulator', timeout=0.5, transport=simulator.loopback)
+    assert client.connect()
+    yield client
+    client.close()
+
+
+def test_client_poll_decodes_the_simulator(client, simulator):
+    intInfo, realInfo, oneBitsInfo = client.poll()
+    assert realInfo['Actual mass'] == pytest.approx(simulator.actual_mass, abs=1e-3)
+    assert intInfo['Current RAW signal'] == simulator.raw
+    assert intInfo['Sampling frequency'] == 123
+    assert intInfo['Sensor capacity'] == 50
+    assert oneBitsInfo['stability'] and not oneBitsInfo['overload_conn error']
+
+
+def test_client_poll_is_one_transaction_per_block(client):
+    client.registerCache = None
+    transactions = client.metrics.transactions
+    intInfo, realInfo, oneBitsInfo = client.poll()
+    assert client.metrics.transactions - transactions == len(client.pollPlan) == 2
+    assert set(intInfo) | set(realInfo) | set(oneBitsInfo) == set(registerMap)
+
+
+def test_client_tare_and_sampling_frequency(client, simulator):
+    client.poll()
+    client.send_request(tare=True)
+    assert client.poll()[1]['Actual mass'] == pytest.approx(0.0, abs=1e-3)
+    client.set_samplingFrequency(33)
+    assert simulator.sampling_frequency == 33
+    assert client.poll()[0]['Sampling frequency'] == 33
+    with pytest.raises(ValueError):
+        client.set_samplingFrequency(34)
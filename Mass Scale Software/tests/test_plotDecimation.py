@@ -0,0 +1,50 @@
+import numpy as np
+
+from plotDecimation import MinMaxPyramid
+
+
+def series(count=100003, seed=0):
+    return np.arange(count) * 0.01, np.random.default_rng(seed).normal(size=count)
+
+
+def test_appended_in_batches_renders_as_loaded():
+    times, values = series()
+    appended = MinMaxPyramid()
+    start = 0
+    for size in np.random.default_rng(1).integers(1, 500, len(times)):
+        appended.extend(times[start:start + size], values[start:start + size])
+        start += size
+        if start >= len(times):
+            break
+    loaded = MinMaxPyramid()
+    loaded.load(times, values)
+    assert len(appended) == len(loaded) == len(times)
+    assert loaded.data is None      # levels only, points are read from the arrays
+    for view in ((0, 2000, 1000), (100, 105, 1000), (10, 900, 300), (999.9, 2000, 100)):
+        for expected, actual in zip(appended.render(*view), loaded.render(*view)):
+            np.testing.assert_array_equal(expected, actual)
+
+
+def test_render_keeps_peaks_and_limits_points():
+    times, values = series()
+    pyramid = MinMaxPyramid()
+    pyramid.load(times, values)
+    x, y = pyramid.render(*pyramid.bounds(), 500)
+    assert len(x) <= 4 * 500
+    assert y.max() == values.max() and y.min() == values.min()
+    assert np.all(np.diff(x) >= 0)
+
+
+def test_zoomed_in_reads_full_resolution_from_the_source():
+    times, values = series()
+    reads = []
+
+    def source(start, stop):
+        reads.append((start, stop))
+        return times[start:stop], values[start:stop]
+    pyramid = MinMaxPyramid(source=source)
+    pyramid.extend(times, values)
+    x, y = pyramid.render(500, 501, 1000)
+    assert reads and all(stop - start < 200 for start, stop in reads)
+    np.testing.assert_array_equal(x, times[49999:50101])
+    np.testing.assert_array_equal(y, values[49999:50101])
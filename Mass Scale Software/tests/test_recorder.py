@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pytest
+
+from acquisition import Sample
+from plotDecimation import MinMaxPyramid
+from recorder import StreamRecorder, open_recording, read_wdtHeader, export_recording, status_toBits, \
+    build_summary, load_summary, summary_path
+from runningStats import RunningStats
+
+
+def samples(count, start=1.7e9, frequency=100):
+    bits = {'input tara': False, 'overload_conn error': False, 'general error': False, 'stability': True}
+    return [Sample(start + i / frequency, 0.5 * i, 1000 + i, {'Sampling frequency': frequency}, {},
+                   dict(bits, **{'overload_conn error': i % 3 == 0}), 1) for i in range(count)]
+
+
+@pytest.fixture
+def recording(tmp_path):
+    recorder = StreamRecorder('wdt', chunk_size=64, flush_interval=60, path=str(tmp_path / 'recording.wdt'),
+                              header={'unit': 1, 'sampling_frequency': 100})
+    yield recorder
+    recorder.close()
+
+
+def test_wdt_round_trip(recording):
+    written = samples(1000)
+    recording.append(written)
+    recording.close()
+    header, records = open_recording(recording.path)
+    assert isinstance(records, np.memmap)
+    assert header['count'] == len(records) == 1000
+    assert header['unit'] == 1 and 'stopped' in header
+    assert header['status_bits'] == list(written[0].oneBitsInfo)
+    assert np.dtype([tuple(field) for field in header['fields']]) == records.dtype
+    np.testing.assert_array_equal(records['timestamp'], [s.timestamp for s in written])
+    np.testing.assert_allclose(records['mass'], [s.mass for s in written], rtol=1e-6)
+    np.testing.assert_array_equal(records['raw'], [s.raw for s in written])
+    np.testing.assert_array_equal(records['status'], [status_toBits(s.oneBitsInfo) for s in written])
+
+
+def test_wdt_interrupted_recording_is_readable(recording):
+    recording.append(samples(70))       # flushed
+    recording.append(samples(20))       # still pending - lost in a crash
+    with open(recording.path, 'ab') as file:
+        file.write(b'\0' * 5)           # partial record
+    header, records = open_recording(recording.path)
+    assert 'count' not in header
+    assert len(records) == 70
+
+
+def test_wdt_frequency_changes_in_header(recording):
+    recording.append(samples(10, frequency=100) + samples(10, start=1.8e9, frequency=33))
+    recording.close()
+    header, offset = read_wdtHeader(recording.path)
+    assert header['frequency_changes'] == [[1.8e9, 33]]
+    assert offset == 4096
+
+
+def test_read_back_while_recording(recording):
+    written = samples(150)
+    recording.append(written[:100])
+    recording.append(written[100:])
+    assert len(recording.chunk) == 50
+    for start, stop in ((0, 150), (60, 70), (120, 140), (140, 200)):
+        np.testing.assert_array_equal(recording.read(start, stop)['timestamp'],
+                                      [s.timestamp for s in written[start:stop]])
+
+
+def test_summary_round_trip(recording):
+    recording.append(samples(5000))
+    recording.close()
+    header, records = open_recording(recording.path)
+    pyramid, stats = MinMaxPyramid(), RunningStats()
+    assert not load_summary(recording.path, records, pyramid, stats)
+    build_summary(recording.path, records, pyramid, stats)
+    assert os.path.exists(summary_path(recording.path))
+
+    restored, restoredStats = MinMaxPyramid(), RunningStats()
+    assert load_summary(recording.path, records, restored, restoredStats)
+    assert restoredStats.state() == stats.state()
+    assert (stats.count, stats.min, stats.max) == (5000, 0.0, 2499.5)
+    for x_min, x_max in ((0, 2e9), (1.7e9 + 10, 1.7e9 + 11)):
+        for expected, actual in zip(pyramid.render(x_min, x_max, 100), restored.render(x_min, x_max, 100)):
+            np.testing.assert_array_equal(expected, actual)
+
+
+def test_stale_summary_is_ignored(recording):
+    recording.append(samples(100))
+    recording.close()
+    header, records = open_recording(recording.path)
+    build_summary(recording.path, records, MinMaxPyramid(), RunningStats())
+    assert not load_summary(recording.path, records[:50], MinMaxPyramid(), RunningStats())
+
+
+def test_export_csv(recording, tmp_path):
+    recording.append(samples(10))
+    recording.close()
+    output = str(tmp_path / 'recording.csv')
+    assert export_recording(recording.path, output, chunk_size=4) == 10
+    with open(output) as file:
+        lines = file.read().splitlines()
+    assert lines[0] == 'timestamp;time;mass;raw;status'
+    assert len(lines) == 11
+    assert lines[2].split(';')[2:] == ['0.5', '1001', '8']
+
+
+def test_discard_removes_the_temporary_file():
+    recorder = StreamRecorder('csv')
+    recorder.append(samples(3))
+    recorder.discard()
+    assert not os.path.exists(recorder.path)
+
+
+def test_export_keeps_the_float64_mass_of_npy_recordings(tmp_path):
+    recorder = StreamRecorder('npy', path=str(tmp_path / 'recording.npy'))
+    written = [sample._replace(mass=50000.0 + i / 3) for i, sample in enumerate(samples(10))]
+    recorder.append(written)
+    recorder.close()
+    output = str(tmp_path / 'recording.csv')
+    assert export_recording(recorder.path, output) == 10
+    with open(output) as file:
+        masses = [float(line.split(';')[2]) for line in file.read().splitlines()[1:]]
+    assert masses == [sample.mass for sample in written]
+
+
+def test_export_parquet_keeps_the_recording_dtype(recording, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    recording.append(samples(10))
+    recording.close()
+    output = str(tmp_path / 'recording.parquet')
+    assert export_recording(recording.path, output, chunk_size=4) == 10
+    table = pq.read_table(output)
+    assert str(table.schema.field('mass').type) == 'float'
+    assert table.column('raw').to_pylist() == [1000 + i for i in range(10)]
@@ -0,0 +1,56 @@
+import pytest
+
+from modbusConnection import ModbusClient, RegisterCache, registerMap
+
+
+def covered(plan):
+    return {key for block in plan for info, key, offset, width in block.fields}
+
+
+def test_registerCache_reads_only_due_fields():
+    cache = RegisterCache()
+    first = cache.plan(now=0.0)
+    assert covered(first) == set(registerMap)
+    for block in first:
+        cache.mark_read(block, now=0.0)
+    due = covered(cache.plan(now=0.1))
+    assert due == {key for key, field in registerMap.items() if field.refresh == 'sample'}
+    assert 'Minimum registered force' in covered(cache.plan(now=0.6))
+    assert 'Sensor capacity' not in covered(cache.plan(now=1000.0))
+
+
+def test_registerCache_plans_are_reused():
+    cache = RegisterCache()
+    for block in cache.plan(now=0.0):
+        cache.mark_read(block, now=0.0)
+    assert cache.plan(now=0.1) is cache.plan(now=0.2)
+
+
+def test_registerCache_write_invalidates_dependent_fields():
+    cache = RegisterCache()
+    for block in cache.plan(now=0.0):
+        cache.mark_read(block, now=0.0)
+    cache.written('coil', 4000)
+    due = covered(cache.plan(now=0.1))
+    assert {'Minimum registered real force', 'Maximum registered real force'} <= due
+    assert 'Sampling frequency' not in due
+    cache.written('register', 12)
+    assert 'Sampling frequency' in covered(cache.plan(now=0.1))
+
+
+@pytest.fixture
+def client(simulator):
+    client = ModbusClient(method='rtu', port='simulator', timeout=0.5, transport=simulator.loopback)
+    assert client.connect()
+    yield client
+    client.close()
+
+
+def test_client_poll_reads_the_due_blocks(client):
+    client.poll()
+    plan = client.registerCache.plan()
+    assert covered(plan) == {key for key, field in registerMap.items() if field.refresh == 'sample'}
+    transactions = client.metrics.transactions
+    client.poll()
+    assert client.metrics.transactions - transactions == len(plan)
+    assert client.metrics.errors == dict.fromkeys(client.metrics.error_kinds, 0)
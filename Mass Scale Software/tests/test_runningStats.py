@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from runningStats import RunningStats, WindowedStats
+
+
+def test_running_stats_update_and_extend_agree():
+    rng = np.random.default_rng(0)
+    values = 5e4 + rng.normal(0, 0.01, 10000)
+    times = np.arange(len(values)) / 100
+    updated, extended = RunningStats(), RunningStats()
+    for timestamp, value in zip(times, values):
+        updated.update(timestamp, value)
+    for start in range(0, len(values), 777):
+        extended.extend(times[start:start + 777], values[start:start + 777])
+    for stats in (updated, extended):
+        assert stats.count == len(values)
+        assert (stats.min, stats.max) == (values.min(), values.max())
+        assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+        assert stats.std == pytest.approx(values.std(ddof=1), rel=1e-6)
+        assert stats.duration == pytest.approx(times[-1])
+
+
+def test_running_stats_state_round_trip():
+    stats = RunningStats()
+    stats.extend([0.0, 1.0, 2.0], [3.0, 1.0, 2.0])
+    restored = RunningStats()
+    restored.restore(stats.state())
+    assert restored.state() == stats.state()
+
+
+def test_windowed_stats_match_a_brute_force_window():
+    rng = np.random.default_rng(1)
+    values = 5e4 + rng.normal(0, 0.01, 200000)
+    values[::5000] += 1.0       # steps in and out of the window
+    times = np.arange(len(values)) / 123
+    stats = WindowedStats(window=10.0)
+    for i, (timestamp, value) in enumerate(zip(times, values)):
+        stats.update(timestamp, value)
+        if i % 9973 == 9972 or i == len(values) - 1:
+            window = values[(times >= timestamp - 10.0) & (times <= timestamp)]
+            assert stats.count == len(window)
+            assert (stats.min, stats.max) == (window.min(), window.max())
+            assert stats.mean == pytest.approx(window.mean(), rel=1e-12)
+            assert stats.std == pytest.approx(window.std(ddof=1), rel=1e-3)
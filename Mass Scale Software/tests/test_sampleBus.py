@@ -0,0 +1,34 @@
+from acquisition import SampleBus, Sample
+
+
+def test_sampleBus_throttles_without_losing_samples():
+    bus, batches = SampleBus(), []
+    bus.subscribe(batches.append, max_rate=1, unit=1)
+    for i in range(5):
+        bus.publish([Sample(i, 0.0, 0, {}, {}, {}, 1), Sample(i, 0.0, 0, {}, {}, {}, 2)])
+    assert len(batches) == 1 and len(batches[0]) == 1     # the first publish, the rest is pending
+    bus.subscriptions[0].last_delivery = 0.0
+    bus.publish([])
+    assert [len(batch) for batch in batches] == [1, 4]
+
+
+def test_unsubscribe_flushes_the_pending_batch():
+    bus, batches = SampleBus(), []
+    subscription = bus.subscribe(batches.append, max_rate=1)
+    for i in range(3):
+        bus.publish([Sample(i, 0.0, 0, {}, {}, {}, 1)])
+    bus.unsubscribe(subscription, flush=True)
+    bus.publish([Sample(3, 0.0, 0, {}, {}, {}, 1)])
+    assert [[sample.timestamp for sample in batch] for batch in batches] == [[0], [1, 2]]
+
+
+def test_failing_subscriber_does_not_starve_the_others():
+    bus, batches = SampleBus(), []
+
+    def failing(batch):
+        raise ValueError("consumer bug")
+    bus.subscribe(failing)
+    bus.subscribe(batches.append)
+    bus.publish([Sample(0, 0.0, 0, {}, {}, {}, 1)])
+    bus.publish([Sample(1, 0.0, 0, {}, {}, {}, 1)])
+    assert [batch[0].timestamp for batch in batches] == [0, 1]
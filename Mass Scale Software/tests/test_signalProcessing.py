@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from acquisition import Sample
+from signalProcessing import MovingAverage, MovingMedian, ExponentialMovingAverage, StabilityDetector, PeakCapture, \
+    SignalPipeline
+
+
+def signal(count=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate((np.zeros(count // 2), np.full(count - count // 2, 100.0))) + rng.normal(0, 0.2, count)
+
+
+def in_batches(process, values, sizes=(1, 7, 3, 50, 2, 120)):
+    outputs, start, i = [], 0, 0
+    while start < len(values):
+        size = sizes[i % len(sizes)]
+        outputs.append(process(values[start:start + size]))
+        start += size
+        i += 1
+    return np.concatenate(outputs)
+
+
+@pytest.mark.parametrize('make', [lambda: MovingAverage(10), lambda: MovingMedian(5), lambda: MovingMedian(1),
+                                  lambda: ExponentialMovingAverage(0.1), lambda: ExponentialMovingAverage(0.001)])
+def test_filters_split_into_batches_match_the_whole_signal(make):
+    values = signal()
+    np.testing.assert_allclose(in_batches(make().process, values), make().process(values), rtol=1e-9, atol=1e-9)
+
+
+def test_moving_average_warmup():
+    np.testing.assert_allclose(MovingAverage(3).process([3, 6, 9, 12]), [3, 4.5, 6, 9])
+
+
+def test_moving_median_removes_spikes():
+    values = np.full(20, 10.0)
+    values[7] = 1000
+    assert MovingMedian(5).process(values).max() == 10
+
+
+def test_ema_matches_the_recursion():
+    values = signal(300)
+    alpha, expected, last = 0.05, [], None
+    for value in values:
+        last = value if last is None else alpha * value + (1 - alpha) * last
+        expected.append(last)
+    np.testing.assert_allclose(ExponentialMovingAverage(alpha).process(values), expected, rtol=1e-9)
+
+
+def test_stability_split_into_batches_matches_the_whole_signal():
+    values = signal()
+    times = np.arange(len(values)) / 100
+    whole = StabilityDetector(size=20, threshold=0.5, settle_time=0.3).process(times, values)
+    detector = StabilityDetector(size=20, threshold=0.5, settle_time=0.3)
+    split = np.concatenate([detector.process(times[i:i + 13], values[i:i + 13]) for i in range(0, len(values), 13)])
+    np.testing.assert_array_equal(split, whole)
+    assert not whole[:20].any() and whole[-1]
+    assert not whole[250:270].any()     # the step
+
+
+def test_peak_and_plateaus():
+    values = signal()
+    times = np.arange(len(values)) / 100
+    stable = StabilityDetector(size=20, threshold=0.5, settle_time=0.3).process(times, values)
+    capture = PeakCapture()
+    capture.process(times, values, stable)
+    assert capture.peak == values.max()
+    assert [round(plateau.mean) for plateau in capture.plateaus] == [0]
+    assert capture.plateau == pytest.approx(100, abs=0.1)
+
+
+def test_pipeline_mass_from_raw():
+    raw = 120 + signal() / 0.1836
+    samples = [Sample(i / 100, 0.0, value, {}, {}, {}) for i, value in enumerate(raw)]
+    pipeline = SignalPipeline(scale=0.1836, tare=120, filter='none')
+    processed = pipeline.process(samples)
+    np.testing.assert_allclose(processed.mass, signal(), atol=1e-9)
+    assert pipeline.mass == pytest.approx(100, abs=1)
+    assert SignalPipeline(scale=1, filter='median').filter.size == 5
+
+
+def test_stability_window_in_time_ignores_the_sample_rate():
+    values = signal()
+    for rate in (26, 123):
+        times = np.arange(len(values)) / rate
+        detector = StabilityDetector(window=0.5, threshold=0.5, settle_time=0.3)
+        split = np.concatenate([detector.process(times[i:i + 13], values[i:i + 13])
+                                for i in range(0, len(values), 13)])
+        np.testing.assert_array_equal(split, StabilityDetector(window=0.5, threshold=0.5, settle_time=0.3)
+                                      .process(times, values))
+        assert not split[times < 0.5].any() and split[-1]
+        assert not split[(times >= times[250]) & (times < times[250] + 0.5)].any()     # the step
+        assert len(detector.history) <= 0.5 * rate + 1
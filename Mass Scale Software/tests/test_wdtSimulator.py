@@ -0,0 +1,74 @@
+import struct
+import time
+
+import pytest
+from pymodbus.utilities import computeCRC
+
+from modbusConnection import registers_toFloat
+from wdtSimulator import WDT11Simulator, SimulatedBus, float_toRegisters, request_length, TARE_COIL
+
+
+def request(unit, function, address, value):
+    frame = struct.pack('>BBHH', unit, function, address, value)
+    return frame + struct.pack('>H', computeCRC(frame))
+
+
+def registers(response):
+    return list(struct.unpack(f'>{response[2] // 2}H', response[3:-2]))
+
+
+def test_float_registers_round_trip():
+    for value in (0.0, 250.0, -1.5, 1234.5678):
+        assert registers_toFloat(float_toRegisters(value)) == pytest.approx(value, rel=1e-6)
+
+
+def test_read_holding_registers(simulator):
+    response = simulator.handle_frame(request(1, 0x03, 20, 2))
+    assert response[:3] == bytes([1, 0x03, 4])
+    assert struct.pack('>H', computeCRC(response[:-2])) == response[-2:]
+    assert registers_toFloat(registers(response)) == pytest.approx(250.0, abs=0.2)
+    assert simulator.handle_frame(request(1, 0x03, 28, 4))[1] == 0x83     # past the register map
+
+
+def test_other_units_and_broken_frames_get_no_response(simulator):
+    assert simulator.handle_frame(request(2, 0x03, 0, 1)) is None
+    assert simulator.handle_frame(request(1, 0x03, 0, 1)[:-1] + b'\0') is None
+    assert simulator.requests == 0
+
+
+def test_tare_coil_and_sampling_frequency_register(simulator):
+    simulator.handle_frame(request(1, 0x05, TARE_COIL, 0xFF00))
+    time.sleep(0.02)    # the readout follows at the next conversion
+    assert registers_toFloat(registers(simulator.handle_frame(request(1, 0x03, 20, 2)))) == pytest.approx(0.0, abs=1e-3)
+    assert simulator.handle_frame(request(1, 0x06, 12, 0)) == request(1, 0x06, 12, 0)
+    assert simulator.sampling_frequency != 123
+    assert simulator.handle_frame(request(1, 0x06, 12, 999))[1] == 0x86
+
+
+def test_injected_faults():
+    silent = WDT11Simulator(timeout_rate=1.0, seed=0)
+    assert silent.handle_frame(request(1, 0x03, 0, 1)) is None and silent.requests == 1
+    corrupted = WDT11Simulator(crc_error_rate=1.0, seed=0)
+    response = corrupted.handle_frame(request(1, 0x03, 0, 1))
+    assert struct.pack('>H', computeCRC(response[:-2])) != response[-2:]
+
+
+def test_bus_routes_frames_by_unit():
+    bus = SimulatedBus([WDT11Simulator(unit=unit, waveform='constant', mass=100.0 * unit, noise=0.0)
+                        for unit in (1, 2)])
+    for unit in (1, 2):
+        response = bus.handle_frame(request(unit, 0x03, 20, 2))
+        assert response[0] == unit
+        assert registers_toFloat(registers(response)) == pytest.approx(100.0 * unit, abs=0.2)
+    assert bus.handle_frame(request(3, 0x03, 20, 2)) is None
+
+
+def test_loopback_line_timing():
+    simulator = WDT11Simulator(baudrate=9600, turnaround=0.01)
+    frame = request(1, 0x03, 0, 30)
+    assert simulator.response_delay(8, 65) == pytest.approx(73 * 10 / 9600 + 0.01)
+    assert request_length(frame[:1]) is None and request_length(frame) == 8
+    line = simulator.loopback(timeout=0.5)
+    line.write(frame)
+    assert line.in_waiting == 0
+    assert len(line.read(65)) == 65
@@ -0,0 +1,321 @@
+"""
+Software stand-in for the WDT-11 acquisition card, for testing and benchmarking without the RS485 hardware.
+
+WDT11Simulator serves the register map of modbusConnection (intAddresses, realAddresses, oneBitsReadRegisters) as a
+Modbus RTU slave, emits a configurable mass waveform with noise and reacts to the tare/reset coils 4000/4001 and to
+writes of the sampling frequency register (12). It can be reached:
+    - in-process: ModbusClient(..., transport=simulator.loopback)
+    - in-process with asyncio: AsyncModbusClient(..., open_connection=simulator.open_connection)
+    - over a pseudo-terminal pair (POSIX): port = simulator.serve_pty(), then ModbusClient(port=port, ...)
+Line timing follows the configured baud rate, faults (no response, CRC errors, overload) can be injected.
+"""
+import asyncio
+import math
+import os
+import random
+import struct
+import threading
+import time
+
+from pymodbus.utilities import computeCRC
+
+from modbusConnection import freq_translation, freq_codes
+
+TARE_COIL = 4000
+RESET_MIN_MAX_COIL = 4001
+
+
+def float_toRegisters(value: float) -> list:
+    # inverse of registers_toFloat - low word first, big endian bytes inside a word
+    high, low = struct.unpack('>HH', struct.pack('>f', value))
+    return [low, high]
+
+
+def char_time(baudrate: int, parity='N', stopbits=1, bytesize=8) -> float:
+    # seconds on the line per transmitted byte (start bit + data + parity + stop bits)
+    return (1 + bytesize + (0 if parity == 'N' else 1) + stopbits) / baudrate
+
+
+class WDT11Simulator:
+    def __init__(self, unit=1, baudrate=19200, parity='N', stopbits=1, bytesize=8, waveform='step', mass=500.0,
+                 period=10.0, noise=0.2, sampling_frequency=123, sensor_capacity=50, turnaround=0.002,
+                 line_timing=True, timeout_rate=0.0, crc_error_rate=0.0, overload=False, seed=None):
+        self.unit = unit
+        self.baudrate = baudrate
+        self.char_time = char_time(baudrate, parity, stopbits, bytesize)
+        self.waveform = waveform        # 'constant', 'step', 'sine' or 'ramp'
+        self.mass = mass                # waveform amplitude [g]
+        self.period = period            # waveform period [s]
+        self.noise = noise              # standard deviation of gaussian noise [g]
+        self.frequency_code = freq_codes[sampling_frequency]
+        self.sensor_capacity = sensor_capacity
+        self.turnaround = turnaround    # device processing time between request and response [s]
+        self.line_timing = line_timing  # delay responses as a real line at the configured baud rate would
+        self.timeout_rate = timeout_rate        # fraction of requests left without a response
+        self.crc_error_rate = crc_error_rate    # fraction of responses sent with a corrupted CRC
+        self.overload = overload
+        self.random = random.Random(seed)
+
+        self.mass_scaleFromRaw = 0.18355970571590265987549518958687
+        self.mV_scale = 0.00078691347
+        self.zero_raw = 120             # raw signal of the unloaded sensor
+        self.tare_raw = self.zero_raw
+        self.min_mass = math.inf
+        self.max_mass = -math.inf
+        self.start_time = time.perf_counter()
+        self.last_update = None
+        self.raw = self.zero_raw
+        self.actual_mass = 0.0
+        self.stable = True
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._ptyThread = None
+        self._ptyStop = threading.Event()
+
+    # ---------------------------------------------------------------------------------------------- device model
+    @property
+    def sampling_frequency(self):
+        return freq_translation[self.frequency_code]
+
+    def waveform_value(self, t: float) -> float:
+        if self.waveform == 'step':
+            return self.mass if (t % self.period) >= self.period / 2 else 0.0
+        elif self.waveform == 'sine':
+            return self.mass * (0.5 + 0.5 * math.sin(2 * math.pi * t / self.period))
+        elif self.waveform == 'ramp':
+            return self.mass * (t % self.period) / self.period
+        return self.mass
+
+    def update_measurement(self):
+        # the converter refreshes its readout at the sampling frequency, reads in between return the last value
+        t = time.perf_counter() - self.start_time
+        sample_index = int(t * self.sampling_frequency)
+        if sample_index == self.last_update:
+            return
+        self.last_update = sample_index
+        t = sample_index / self.sampling_frequency
+        loaded_mass = self.waveform_value(t) + self.random.gauss(0.0, self.noise)
+        self.raw = int(round(self.zero_raw + loaded_mass / self.mass_scaleFromRaw))
+        self.actual_mass = (self.raw - self.tare_raw) * self.mass_scaleFromRaw
+        self.min_mass = min(self.min_mass, self.actual_mass)
+        self.max_mass = max(self.max_mass, self.actual_mass)
+        self.stable = abs(self.waveform_value(t) - self.waveform_value(t - 0.3)) < max(3 * self.noise, 0.5)
+
+    def holding_registers(self) -> list:
+        registers = [0] * 30
+        force = int(self.actual_mass * 0.00980665 * 100) & 0xFFFF     # cN
+        registers[0] = registers[14] = force
+        registers[2] = int(self.min_mass * 0.00980665 * 100) & 0xFFFF
+        registers[4] = int(self.max_mass * 0.00980665 * 100) & 0xFFFF
+        registers[6] = self.raw & 0xFFFF
+        registers[8] = 2
+        registers[10] = self.sensor_capacity
+        registers[12] = self.frequency_code
+        registers[13] = int(self.raw * self.mV_scale * 1000) & 0xFFFF
+        registers[15] = int(self.stable)
+        for address, value in ((20, self.actual_mass), (22, self.min_mass), (24, self.max_mass),
+                               (26, self.raw * self.mV_scale), (28, 2.0)):
+            registers[address:address + 2] = float_toRegisters(value)
+        return registers
+
+    def discrete_inputs(self) -> dict:
+        overloaded = self.overload or self.raw * self.mass_scaleFromRaw > self.sensor_capacity / 0.00980665
+        return {5000: self.tare_raw != self.zero_raw, 5001: overloaded, 5002: False, 5003: self.stable}
+
+    def write_coil(self, address: int, value: bool):
+        if address == TARE_COIL and value:
+            self.tare_raw = self.raw
+        elif address == RESET_MIN_MAX_COIL and value:
+            self.min_mass = self.max_mass = self.actual_mass
+
+    # ---------------------------------------------------------------------------------------------- RTU protocol
+    def handle_frame(self, request: bytes):
+        # returns the response frame, or None when the slave stays silent
+        if len(request) < 4 or struct.pack('>H', computeCRC(request[:-2])) != request[-2:]:
+            return None
+        unit, function = request[0], request[1]
+        if unit != self.unit:
+            return None
+        with self.lock:
+            self.requests += 1
+            if self.random.random() < self.timeout_rate:
+                return None
+            self.update_measurement()
+            body = self._execute(function, request[2:-2])
+        frame = bytes([unit]) + body
+        crc = computeCRC(frame)
+        if self.random.random() < self.crc_error_rate:
+            crc ^= 0xFFFF
+        return frame + struct.pack('>H', crc)
+
+    def _execute(self, function: int, data: bytes) -> bytes:
+        if function in (0x01, 0x02, 0x03, 0x04, 0x05, 0x06):
+            address, value = struct.unpack('>HH', data[:4])
+        else:
+            return bytes([function | 0x80, 0x01])   # illegal function
+        if function == 0x03 or function == 0x04:
+            registers = self.holding_registers()
+            if address + value > len(registers) or value < 1:
+                return bytes([function | 0x80, 0x02])   # illegal data address
+            payload = struct.pack(f'>{value}H', *registers[address:address + value])
+            return bytes([function, len(payload)]) + payload
+        elif function in (0x01, 0x02):
+            inputs = self.discrete_inputs()
+            bits = [bool(inputs.get(address + i, False)) for i in range(value)]
+            payload = bytes(sum(1 << j for j, bit in enumerate(bits[i:i + 8]) if bit) for i in range(0, value, 8))
+            return bytes([function, len(payload)]) + payload
+        elif function == 0x05:
+            self.write_coil(address, value == 0xFF00)
+        elif function == 0x06:
+            if address != 12 or value not in freq_translation:
+                return bytes([function | 0x80, 0x02])
+            self.frequency_code = value
+        return bytes([function]) + data[:4]
+
+    def response_delay(self, request_size: int, response_size: int) -> float:
+        if not self.line_timing:
+            return 0.0
+        return (request_size + response_size) * self.char_time + self.turnaround
+
+    # ---------------------------------------------------------------------------------------------- transports
+    def loopback(self, timeout=1.0):
+        # factory for ModbusClient(transport=...)
+        return LoopbackSerial(self, timeout)
+
+    async def open_connection(self):
+        # asyncio (reader, writer) pair for AsyncModbusClient(open_connection=...)
+        reader = asyncio.StreamReader()
+        return reader, LoopbackStreamWriter(self, reader)
+
+    def serve_pty(self) -> str:
+        # serves the simulator on the master side of a pseudo-terminal pair, returns the slave device path
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        self._ptyStop.clear()
+        self._ptyThread = threading.Thread(target=self._serve_fd, args=(master,), name='WDT11Simulator', daemon=True)
+        self._ptyThread.start()
+        return os.ttyname(slave)
+
+    def stop(self):
+        self._ptyStop.set()
+
+    def _serve_fd(self, descriptor):
+        import select
+        buffer = b''
+        while not self._ptyStop.is_set():
+            readable, _, _ = select.select([descriptor], [], [], 0.1)
+            if not readable:
+                buffer = b''    # silent interval - drop incomplete frame
+                continue
+            buffer += os.read(descriptor, 256)
+            size = request_length(buffer)
+            if size is None or len(buffer) < size:
+                continue
+            request, buffer = buffer[:size], buffer[size:]
+            response = self.handle_frame(request)
+            if response is not None:
+                time.sleep(self.response_delay(len(request), len(response)))
+                os.write(descriptor, response)
+        os.close(descriptor)
+
+
+class SimulatedBus:
+    # several simulated units on one RS485 line, frames are answered by the unit they are addressed to
+    def __init__(self, simulators):
+        self.simulators = {simulator.unit: simulator for simulator in simulators}
+
+    def handle_frame(self, request: bytes):
+        simulator = self.simulators.get(request[0]) if request else None
+        return simulator.handle_frame(request) if simulator is not None else None
+
+    def response_delay(self, request_size: int, response_size: int) -> float:
+        return next(iter(self.simulators.values())).response_delay(request_size, response_size)
+
+    def loopback(self, timeout=1.0):
+        return LoopbackSerial(self, timeout)
+
+    async def open_connection(self):
+        reader = asyncio.StreamReader()
+        return reader, LoopbackStreamWriter(self, reader)
+
+
+def request_length(buffer: bytes):
+    # length of the RTU request frame at the beginning of buffer, None if it can not be told yet
+    if len(buffer) < 2:
+        return None
+    if buffer[1] in (0x0F, 0x10):
+        return 9 + buffer[6] if len(buffer) >= 7 else None
+    return 8
+
+
+class LoopbackSerial:
+    """
+    In-process replacement of serial.Serial connected to a WDT11Simulator. Responses become readable after the time
+    the request and the response would need on a real line at the simulator's baud rate.
+    """
+    def __init__(self, simulator, timeout=1.0):
+        self.simulator = simulator      # WDT11Simulator or SimulatedBus
+        self.timeout = timeout
+        self.is_open = True
+        self._response = b''
+        self._ready_at = 0.0
+
+    @property
+    def in_waiting(self):
+        return len(self._response) if time.perf_counter() >= self._ready_at else 0
+
+    def write(self, data: bytes) -> int:
+        response = self.simulator.handle_frame(bytes(data))
+        self._response = response or b''
+        self._ready_at = time.perf_counter() + self.simulator.response_delay(len(data), len(self._response))
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        deadline = time.perf_counter() + (self.timeout or 0)
+        if not self._response:
+            time.sleep(max(deadline - time.perf_counter(), 0))
+            return b''
+        delay = self._ready_at - time.perf_counter()
+        if delay > 0:
+            if delay > (self.timeout or 0):
+                time.sleep(self.timeout or 0)
+                return b''
+            time.sleep(delay)
+        data, self._response = self._response[:size], self._response[size:]
+        return data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._response = b''
+
+    def close(self):
+        self.is_open = False
+
+    def isOpen(self):
+        return self.is_open
+
+
+class LoopbackStreamWriter:
+    # asyncio.StreamWriter stand-in - responses are fed to the paired reader after the simulated line time
+    def __init__(self, simulator: WDT11Simulator, reader: asyncio.StreamReader):
+        self.simulator = simulator
+        self.reader = reader
+
+    def write(self, data: bytes):
+        response = self.simulator.handle_frame(bytes(data))
+        if response is not None:
+            delay = self.simulator.response_delay(len(data), len(response))
+            asyncio.get_running_loop().call_later(delay, self.reader.feed_data, response)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.reader.feed_eof()
+
+    async def wait_closed(self):
+        pass